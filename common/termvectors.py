@@ -0,0 +1,155 @@
+"""
+.. module:: termvectors
+
+termvectors
+******
+
+:Description: termvectors
+
+    Streams the term vectors of the documents of an index, fetching them in
+    batches with multi-termvectors requests instead of one termvectors
+    request per document. Several batches are in flight at the same time,
+    and the documents are yielded in the order they were given.
+
+    Each worker thread sends its requests through a client of its own, with
+    the hosts and connection options of the client given, so no connection
+    is shared by two threads.
+
+    Shared by lab1, lab2 and lab4, whose scripts add this directory to their
+    import path. The deliverable of each of those labs ships it next to its
+    scripts, where it is found first.
+
+:Version:
+
+:Date:  18/10/2026
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from elasticsearch.exceptions import TransportError
+
+BATCH_SIZE = 100  # documents of each multi-termvectors request
+IN_FLIGHT = 4  # requests waiting for an answer at the same time
+
+
+def batches(items: Iterable, size: int) -> Iterator[List]:
+    """
+    Splits items into lists of size elements (the last one may be shorter)
+
+    :param items:
+    :param size:
+    :return:
+    """
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def clone_client(client):
+    """
+    Returns a new client to the hosts of a client, with its connection
+    options but connections of its own
+
+    :param client: Elasticsearch client
+    :return:
+    """
+    transport = client.transport
+    return type(client)(
+        list(transport.hosts), transport_class=type(transport), **transport.kwargs
+    )
+
+
+def fetch_batch(
+    client, index: str, ids: List[str], parameters: Dict
+) -> List[Dict[str, Dict]]:
+    """
+    Returns the terms of the text field of each document, fetching the
+    documents one at a time if the batch fails. Documents that still fail
+    have no terms.
+
+    :param client:
+    :param index:
+    :param ids:
+    :param parameters: termvectors parameters
+    :return:
+    """
+    try:
+        docs = client.mtermvectors(
+            index=index, body={"ids": ids, "parameters": parameters}
+        )["docs"]
+    except TransportError:
+        print("TransportError, fetching the batch by document", file=sys.stderr)
+        docs = []
+        for id in ids:
+            try:
+                docs.append(client.termvectors(index=index, id=id, **parameters))
+            except TransportError:
+                print("TransportError", file=sys.stderr)
+                docs.append({})
+
+    return [
+        doc.get("term_vectors", {}).get("text", {}).get("terms", {}) for doc in docs
+    ]
+
+
+def stream_term_vectors(
+    client,
+    index: str,
+    hits: Iterable[Any],
+    key: Callable[[Any], str] = lambda hit: hit,
+    term_statistics: bool = False,
+    batch_size: int = BATCH_SIZE,
+    in_flight: int = IN_FLIGHT,
+) -> Iterator[Tuple[Any, Dict[str, Dict]]]:
+    """
+    Yields each hit with the terms of the text field of its document, as the
+    "terms" of a termvectors response ({term: {"term_freq": ...}})
+
+    :param client: Elasticsearch client, cloned for each worker thread
+    :param index:
+    :param hits: documents to fetch, for instance the hits of a scan
+    :param key: returns the id of the document of a hit
+    :param term_statistics: also fetch the document frequency of the terms
+    :param batch_size: documents of each request
+    :param in_flight: requests sent before waiting for the first answer
+    :return:
+    """
+    parameters = {
+        "fields": ["text"],
+        "positions": False,
+        "offsets": False,
+        "term_statistics": term_statistics,
+    }
+
+    local = threading.local()
+    clients = []
+
+    def fetch(ids: List[str]) -> List[Dict[str, Dict]]:
+        if not hasattr(local, "client"):
+            local.client = clone_client(client)
+            clients.append(local.client)
+        return fetch_batch(local.client, index, ids, parameters)
+
+    try:
+        with ThreadPoolExecutor(max_workers=in_flight) as executor:
+            pending = deque()
+            for batch in batches(hits, batch_size):
+                ids = [key(hit) for hit in batch]
+                pending.append((batch, executor.submit(fetch, ids)))
+                if len(pending) >= in_flight:
+                    batch, future = pending.popleft()
+                    yield from zip(batch, future.result())
+
+            while pending:
+                batch, future = pending.popleft()
+                yield from zip(batch, future.result())
+    finally:
+        for c in clients:
+            c.transport.close()
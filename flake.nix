@@ -224,19 +224,29 @@
                 zip -r $out/${drv.name}.zip .
               '';
 
-            bundle-deliverable = report: figures: pkgs.runCommand
-              (lib.removeSuffix "-report" report.name)
-              { buildInputs = with pkgs; [ outils ]; }
-              ''
-                mkdir -p $out/{extras,src}
-
-                lndir -silent ${report} $out
-                lndir -silent ${figures} $out/extras
-                lndir -silent ${figures.src} $out/src
+            # Labs whose scripts import common/termvectors.py, shipped next
+            # to them since each lab is delivered on its own
+            termvectors-labs = [ "lab1" "lab2" "lab4" ];
 
-                ln -s ${./poetry.lock} $out/src/poetry.lock
-                ln -s ${./pyproject.toml} $out/src/pyproject.toml
-              '';
+            bundle-deliverable = report: figures:
+              let
+                name = lib.removeSuffix "-report" report.name;
+              in
+              pkgs.runCommand name
+                { buildInputs = with pkgs; [ outils ]; }
+                ''
+                  mkdir -p $out/{extras,src}
+
+                  lndir -silent ${report} $out
+                  lndir -silent ${figures} $out/extras
+                  lndir -silent ${figures.src} $out/src
+
+                  ln -s ${./poetry.lock} $out/src/poetry.lock
+                  ln -s ${./pyproject.toml} $out/src/pyproject.toml
+                  ${lib.optionalString (builtins.elem name termvectors-labs) ''
+                    ln -s ${./common/termvectors.py} $out/src/termvectors.py
+                  ''}
+                '';
 
             lab-reports = builtins.map build-report lab-list;
             lab-figures = builtins.map build-figures lab-list;
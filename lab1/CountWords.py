@@ -19,11 +19,19 @@ CountWords
 """
 
 import argparse
+import os
+import sys
 
 from elasticsearch import Elasticsearch
-from elasticsearch.exceptions import NotFoundError, TransportError
+from elasticsearch.exceptions import NotFoundError
 from elasticsearch.helpers import scan
 
+# The shared modules of the labs are in common/, next to the lab directories
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
+)
+from termvectors import stream_term_vectors  # noqa: E402
+
 __author__ = "bejar"
 
 if __name__ == "__main__":
@@ -40,19 +48,14 @@ if __name__ == "__main__":
         client = Elasticsearch(timeout=1000)
         voc = {}
         sc = scan(client, index=index, query={"query": {"match_all": {}}})
-        for s in sc:
-            try:
-                tv = client.termvectors(index=index, id=s["_id"], fields=["text"])
-                if "text" in tv["term_vectors"]:
-                    for t in tv["term_vectors"]["text"]["terms"]:
-                        if t in voc:
-                            voc[t] += tv["term_vectors"]["text"]["terms"][t][
-                                "term_freq"
-                            ]
-                        else:
-                            voc[t] = tv["term_vectors"]["text"]["terms"][t]["term_freq"]
-            except TransportError:
-                pass
+        # The term vectors are fetched in batches, documents that can not be
+        # fetched have no terms
+        for s, terms in stream_term_vectors(client, index, sc, key=lambda s: s["_id"]):
+            for t in terms:
+                if t in voc:
+                    voc[t] += terms[t]["term_freq"]
+                else:
+                    voc[t] = terms[t]["term_freq"]
         lpal = []
 
         for v in voc:
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: AllPairs
+
+AllPairs
+******
+
+:Description: AllPairs
+
+    Finds the nearest neighbours of every document of an index, the ones with
+    the largest cosine similarity of their TF-IDF vectors, for recommendation
+
+    The normalized TF-IDF matrix X of the documents is read from a vector
+    store of the index (see VectorStore), X.T is its inverted index, and
+    X @ X.T is computed in blocks of rows, as many as fit in the memory
+    budget (--memory-mb), by a pool of processes. Of each row only the k
+    largest similarities (-k) and any similarity of at least --threshold are
+    kept; a document is not its own neighbour and documents without common
+    terms are never neighbours. They are selected in chunks of the rows of a
+    block, which fit in the memory of the sparse product once it is freed.
+
+    The output (--output) is a .npy file of records (row, neighbor, score)
+    with int32 rows of the store and float32 scores, sorted by row and by
+    descending score, that Neighbors memory-maps. The path of each row is
+    saved next to it, in the same file name with .paths.txt
+
+:Version:
+
+:Date:  18/10/2026
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+from typing import List, Tuple
+
+import numpy as np
+from backends import BACKENDS, INDEX_NOT_FOUND
+from VectorStore import VectorStore, open_store
+
+MEMORY_BYTES = 1024 * 2**20  # memory for the blocks of all the processes
+
+# Bytes of each similarity of a block: the sparse product (score and column)
+# and its dense copy, which are alive together
+BYTES_PER_SCORE = 12
+
+# Bytes of each similarity of a chunk of rows whose neighbours are being
+# selected: the index of np.argpartition and a mask of the kept ones
+SELECT_BYTES = 9
+
+RECORD = np.dtype([("row", np.int32), ("neighbor", np.int32), ("score", np.float32)])
+
+
+def block_rows(documents: int, budget: int) -> int:
+    """
+    Returns the number of rows of the blocks that fit in a number of bytes
+
+    :param documents:
+    :param budget:
+    :return:
+    """
+    return max(1, budget // (max(documents, 1) * BYTES_PER_SCORE))
+
+
+def worker_init(store: str, k: int, threshold: float | None):
+    global _X, _XT, _k, _threshold
+    # Both matrices are read from the mapped arrays of the store, shared by
+    # all the processes
+    vectors = VectorStore(store)
+    _X = vectors.matrix()
+    _XT = vectors.postings_matrix()
+    _k = k
+    _threshold = threshold
+
+
+def neighbors_block(block: Tuple[int, int]) -> np.ndarray:
+    """
+    Returns the neighbour records of a block of rows
+
+    :param block: first and last (excluded) row
+    :return:
+    """
+    lo, hi = block
+    scores = (_X[lo:hi] @ _XT).toarray()
+    rows = np.arange(hi - lo)
+    scores[rows, rows + lo] = 0  # not its own neighbour
+
+    # The chunks take the memory of the sparse product, freed by now
+    size = max(1, (hi - lo) * (BYTES_PER_SCORE - scores.itemsize) // SELECT_BYTES)
+    k = min(_k, scores.shape[1])
+    found = []
+    for a in range(0, hi - lo, size):
+        chunk = scores[a : a + size]
+        keep = np.zeros(chunk.shape, dtype=bool)
+        if k > 0:
+            top = np.argpartition(chunk, -k, axis=1)[:, -k:]
+            keep[np.arange(len(chunk))[:, None], top] = True
+            del top
+        if _threshold is not None:
+            keep |= chunk >= _threshold
+        keep &= chunk > 0
+        chunk_rows, chunk_neighbors = np.nonzero(keep)
+        found.append((chunk_rows + a, chunk_neighbors))
+        del keep
+
+    rows = np.concatenate([r for r, _ in found])
+    neighbors = np.concatenate([c for _, c in found])
+    score = scores[rows, neighbors]
+    order = np.lexsort((neighbors, -score, rows))
+
+    records = np.empty(len(order), dtype=RECORD)
+    records["row"] = rows[order] + lo
+    records["neighbor"] = neighbors[order]
+    records["score"] = score[order]
+    return records
+
+
+def all_pairs(
+    store: str,
+    output: str,
+    k: int = 10,
+    threshold: float | None = None,
+    budget: int = MEMORY_BYTES,
+    nprocs: int = max(cpu_count() - 1, 1),
+) -> int:
+    """
+    Computes the neighbours of all the documents of a vector store
+
+    :param store: directory of the vector store
+    :param output: .npy file of the neighbours
+    :param k: neighbours kept for each document
+    :param threshold: also keep every neighbour with at least this similarity
+    :param budget: bytes for the blocks of all the processes
+    :param nprocs:
+    :return: the number of neighbours
+    """
+    vectors = VectorStore(store)
+    n = len(vectors)
+    size = block_rows(n, budget // nprocs)
+    blocks = [(lo, min(lo + size, n)) for lo in range(0, n, size)]
+    print(f"{len(blocks)} blocks of {size} rows", file=sys.stderr)
+
+    # The records of each block are appended to a raw file as they arrive,
+    # and copied to the .npy file when their number is known
+    raw = f"{output}.tmp{os.getpid()}"
+    total = 0
+    with open(raw, "wb") as f, Pool(
+        nprocs, initializer=worker_init, initargs=(store, k, threshold)
+    ) as pool:
+        for records in pool.imap(neighbors_block, blocks):
+            f.write(records.tobytes())
+            total += len(records)
+
+    records = np.lib.format.open_memmap(output, mode="w+", dtype=RECORD, shape=(total,))
+    if total:
+        records[:] = np.memmap(raw, dtype=RECORD, mode="r", shape=(total,))
+    records.flush()
+    del records
+    os.remove(raw)
+
+    with open(f"{output}.paths.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(vectors.paths))
+
+    return total
+
+
+class Neighbors:
+    """
+    Read-only view of a neighbours file written by all_pairs
+    """
+
+    def __init__(self, path: str):
+        self.records = np.load(path, mmap_mode="r")
+        with open(f"{path}.paths.txt", encoding="utf-8") as f:
+            self.paths = f.read().split("\n")
+
+    def neighbors(self, row: int) -> List[Tuple[int, float]]:
+        """
+        Returns the neighbours of a row and their similarity, from the most
+        similar one
+
+        :param row:
+        :return:
+        """
+        rows = self.records["row"]
+        lo, hi = np.searchsorted(rows, [row, row + 1])
+        records = self.records[lo:hi]
+        return list(zip(records["neighbor"].tolist(), records["score"].tolist()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--index",
+        default=None,
+        required=True,
+        help="Index of the documents (directory of the index with --backend local)",
+    )
+    parser.add_argument(
+        "--backend",
+        default="elasticsearch",
+        choices=BACKENDS,
+        help="Where the term vectors are read from",
+    )
+    parser.add_argument(
+        "--store",
+        default=None,
+        required=True,
+        help="Directory of the vector store of the index, built if it is not up "
+        "to date",
+    )
+    parser.add_argument(
+        "--output", default=None, required=True, help="The .npy file of the neighbours"
+    )
+    parser.add_argument(
+        "-k", type=int, default=10, help="Number of neighbours of each document"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="Also keep every neighbour with at least this similarity",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=int,
+        default=MEMORY_BYTES // 2**20,
+        help="Memory for the blocks of all the processes, in MB",
+    )
+    parser.add_argument(
+        "--nprocs",
+        type=int,
+        default=max(cpu_count() - 1, 1),
+        help="Number of processes computing blocks",
+    )
+
+    args = parser.parse_args()
+
+    try:
+        open_store(args.store, args.backend, args.index)
+    except INDEX_NOT_FOUND:
+        print(f"Index {args.index} does not exists", file=sys.stderr)
+        sys.exit(1)
+
+    time1 = time.time()
+    total = all_pairs(
+        args.store,
+        args.output,
+        args.k,
+        args.threshold,
+        args.memory_mb * 2**20,
+        args.nprocs,
+    )
+    print("Neighbours:", total, file=sys.stderr)
+    print("Time:", time.time() - time1, file=sys.stderr)
@@ -5,42 +5,33 @@
 import argparse
 import sys
 from collections import Counter
-from functools import partial, reduce
+from functools import reduce
 from multiprocessing import Pool, cpu_count
 from typing import Iterable
 
-from elasticsearch import Elasticsearch
-from elasticsearch.exceptions import NotFoundError, TransportError
-from elasticsearch_dsl import Search
+from backends import BACKENDS, INDEX_NOT_FOUND, open_backend
 
-__client = None
+_backend = None
 
 
-class EsCounter:
-    def __init__(self, client: Elasticsearch, slices: int):
-        self.slices = slices
+# Each worker opens its own backend (and Elasticsearch client)
+def worker_init(backend: str, index: str):
+    global _backend
+    _backend = open_backend(backend, index)
 
-        global __client
-        __client = client
 
-    def process_slice(self, slice_no: int, index: str) -> Counter[str]:
-        se = (
-            Search(using=__client, index=index)
-            .query("match_all")
-            .extra(slice={"id": slice_no, "max": self.slices})
-        )
-        sc = se.scan()
+class EsCounter:
+    def __init__(self, slices: int):
+        self.slices = slices
 
+    def process_slice(self, slice_no: int) -> Counter[str]:
         counter: Counter = Counter()
-        for s in sc:
-            try:
-                tv = __client.termvectors(index=index, id=s.meta.id, fields=["text"])
-                if "text" in tv["term_vectors"]:
-                    for t, ttv in tv["term_vectors"]["text"]["terms"].items():
-                        counter[t] += ttv["term_freq"]
-            except TransportError:
-                print("TransportError", file=sys.stderr)
-                pass
+        # The term vectors are fetched in batches, documents that can not be
+        # fetched have no terms
+        hits = _backend.scan(slice_no, self.slices)
+        for _, term_freqs in _backend.stream_term_freqs(hits):
+            for t, freq in term_freqs:
+                counter[t] += freq
 
         return counter
 
@@ -51,7 +42,17 @@ def join_counters(counters: Iterable[Counter]) -> Counter:
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--index", default="twitter", help="Index name")
+    parser.add_argument(
+        "--index",
+        default="twitter",
+        help="Index name (directory of the index with --backend local)",
+    )
+    parser.add_argument(
+        "--backend",
+        default="elasticsearch",
+        choices=BACKENDS,
+        help="Where the term vectors are read from",
+    )
     parser.add_argument("--all", action="store_true", help="Dump all the words")
     parser.add_argument(
         "--top", type=int, default=10, help="Number of top words to print"
@@ -61,18 +62,21 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
-    client = Elasticsearch(timeout=1000)
-
-    n_slices = cpu_count() - 1
-    es_counter = EsCounter(client, slices=n_slices)
+    n_slices = max(cpu_count() - 1, 1)
+    es_counter = EsCounter(slices=n_slices)
 
     print("Using {} slices".format(es_counter.slices), file=sys.stderr)
 
-    slice_processor = partial(es_counter.process_slice, index=args.index)
     try:
-        with Pool(n_slices) as pool:
-            voc = join_counters(pool.map(slice_processor, range(n_slices)))
-    except NotFoundError:
+        # Fail here if the index does not exist, not in the workers. Opening
+        # an Elasticsearch backend sends no request, counting the documents
+        # does
+        open_backend(args.backend, args.index).doc_count()
+        with Pool(
+            n_slices, initializer=worker_init, initargs=(args.backend, args.index)
+        ) as pool:
+            voc = join_counters(pool.map(es_counter.process_slice, range(n_slices)))
+    except INDEX_NOT_FOUND:
         print("Index does not exist", file=sys.stderr)
         exit(1)
 
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: LocalIndex
+
+LocalIndex
+******
+
+:Description: LocalIndex
+
+    Builds an on-disk index of the files under the directory passed as a
+    parameter (--path) in the directory passed as a parameter (--index),
+    so that the TF-IDF scripts can run without Elasticsearch (--backend local)
+
+    The files are the ones IndexFilesPreprocess_par.py indexes, and the text
+    is analyzed with the same choice of tokenizer (--token) and filters
+    (--filter). The analyzers approximate the Elasticsearch ones: the
+    tokenizers are regular expressions and the stemming filters need nltk.
+
+    The index directory holds:
+
+    meta.json: number of documents and terms, analyzer and generation
+    paths.txt: path of each document, sorted (the document id is the line)
+    terms.txt: the term dictionary, sorted (the term id is the line)
+    indptr.npy, doc_terms.npy, doc_freqs.npy: term ids and frequencies of
+        the terms of each document, in CSR layout sorted by term id
+    df.npy: number of documents that contain each term
+
+    If the index exists it is replaced, and its generation increased
+
+:Version:
+
+:Date:  18/10/2026
+"""
+
+from __future__ import annotations
+
+import argparse
+import codecs
+import json
+import os
+import re
+import shutil
+import sys
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from typing import Dict, Generator, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+try:
+    from nltk.stem import PorterStemmer, SnowballStemmer
+except ImportError:  # stemming filters are not available
+    PorterStemmer = SnowballStemmer = None
+
+TOKENIZERS = {
+    "standard": re.compile(r"\w+(?:['.]\w+)*"),
+    "classic": re.compile(r"\w+(?:['.@-]\w+)*"),
+    "letter": re.compile(r"[^\W\d_]+"),
+    "whitespace": re.compile(r"\S+"),
+}
+
+# Default stop words of the Elasticsearch stop filter (_english_)
+STOP_WORDS = set(
+    "a an and are as at be but by for if in into is it no not of on or such that "
+    "the their then there these they this to was will with".split()
+)
+
+FILTERS = [
+    "lowercase",
+    "asciifolding",
+    "stop",
+    "porter_stem",
+    "kstem",
+    "snowball",
+]
+
+
+class Analyzer:
+    def __init__(self, token: str = "standard", filter: List[str] = ["lowercase"]):
+        if token not in TOKENIZERS:
+            raise ValueError(f"Unknown tokenizer: {token}")
+
+        self.token = token
+        self.filter = list(filter)
+        self.stemmers = {}
+        for f in self.filter:
+            if f not in FILTERS:
+                raise ValueError(f"Unknown filter: {f}")
+            if f == "kstem" or (f in ("porter_stem", "snowball") and not PorterStemmer):
+                raise ValueError(f"Filter {f} is not available in the local index")
+            if f == "porter_stem":
+                self.stemmers[f] = PorterStemmer().stem
+            elif f == "snowball":
+                self.stemmers[f] = SnowballStemmer("english").stem
+
+    def __call__(self, text: str) -> List[str]:
+        """
+        Returns the terms of a text
+
+        :param text:
+        :return:
+        """
+        terms = TOKENIZERS[self.token].findall(text)
+        for f in self.filter:
+            if f == "lowercase":
+                terms = [t.lower() for t in terms]
+            elif f == "asciifolding":
+                terms = [
+                    unicodedata.normalize("NFKD", t).encode("ascii", "ignore").decode()
+                    for t in terms
+                ]
+                terms = [t for t in terms if t]
+            elif f == "stop":
+                terms = [t for t in terms if t not in STOP_WORDS]
+            else:
+                terms = [self.stemmers[f](t) for t in terms]
+        return terms
+
+
+def generate_files_list(path) -> Generator[str, None, None]:
+    """
+    Generates a list of all the files inside a path, as
+    IndexFilesPreprocess_par.generate_files_list
+
+    :param path:
+    :return:
+    """
+    if path[-1] == "/":
+        path = path[:-1]
+
+    for lf in os.walk(path):
+        if lf[2]:
+            for f in lf[2]:
+                yield lf[0] + "/" + f
+
+
+def count_terms(analyzer: Analyzer, file: str) -> Counter:
+    with codecs.open(file, "r", encoding="iso-8859-1") as f:
+        return Counter(analyzer(f.read()))
+
+
+def build_index(
+    index: str,
+    files: List[str],
+    analyzer: Analyzer,
+    nprocs: int = max(cpu_count() - 2, 2),
+) -> int:
+    """
+    Builds the local index of the files in the directory index, replacing
+    it atomically if it exists
+
+    :param index:
+    :param files:
+    :param analyzer:
+    :param nprocs:
+    :return: the number of indexed documents
+    """
+    paths = sorted(files)
+
+    with Pool(nprocs) as pool:
+        counts = pool.map(partial(count_terms, analyzer), paths, chunksize=64)
+
+    terms = sorted(set().union(*counts))
+    term_ids = {t: i for i, t in enumerate(terms)}
+
+    indptr = np.zeros(len(paths) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(c) for c in counts])
+    doc_terms = np.empty(indptr[-1], dtype=np.int32)
+    doc_freqs = np.empty(indptr[-1], dtype=np.int32)
+    for d, c in enumerate(counts):
+        ids = np.fromiter((term_ids[t] for t in c), np.int32, len(c))
+        freqs = np.fromiter(c.values(), np.int32, len(c))
+        order = np.argsort(ids)
+        doc_terms[indptr[d] : indptr[d + 1]] = ids[order]
+        doc_freqs[indptr[d] : indptr[d + 1]] = freqs[order]
+
+    df = np.bincount(doc_terms, minlength=len(terms))
+
+    try:
+        generation = read_meta(index)["generation"] + 1
+    except FileNotFoundError:
+        generation = 0
+
+    tmp = f"{index.rstrip('/')}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    with open(os.path.join(tmp, "paths.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(paths))
+    with open(os.path.join(tmp, "terms.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(terms))
+    for name, a in [
+        ("indptr", indptr),
+        ("doc_terms", doc_terms),
+        ("doc_freqs", doc_freqs),
+        ("df", df),
+    ]:
+        np.save(os.path.join(tmp, f"{name}.npy"), a)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "documents": len(paths),
+                "terms": len(terms),
+                "token": analyzer.token,
+                "filter": analyzer.filter,
+                "generation": generation,
+            },
+            f,
+        )
+
+    if os.path.exists(index):
+        shutil.rmtree(index)
+    os.replace(tmp, index)
+
+    return len(paths)
+
+
+def read_meta(index: str) -> Dict:
+    with open(os.path.join(index, "meta.json")) as f:
+        return json.load(f)
+
+
+class LocalIndex:
+    """
+    Index built by build_index, with the same interface as
+    backends.ElasticBackend. The arrays are memory-mapped.
+    """
+
+    def __init__(self, index: str):
+        self.index = index
+        self.open()
+
+    def open(self):
+        """
+        Maps the files of the index, as they are on disk now
+        """
+        index = self.index
+        self.meta = read_meta(index)
+
+        with open(os.path.join(index, "paths.txt"), encoding="utf-8") as f:
+            self.paths = f.read().split("\n") if self.meta["documents"] else []
+        with open(os.path.join(index, "terms.txt"), encoding="utf-8") as f:
+            self.terms = f.read().split("\n") if self.meta["terms"] else []
+
+        def load(name):
+            return np.load(os.path.join(index, f"{name}.npy"), mmap_mode="r")
+
+        self.indptr = load("indptr")
+        self.doc_terms = load("doc_terms")
+        self.freqs = load("doc_freqs")
+        self.df = load("df")
+
+    def doc_id(self, path: str) -> int:
+        i = bisect_left(self.paths, path)
+        if i == len(self.paths) or self.paths[i] != path:
+            raise NameError(f"File [{path}] not found")
+        return i
+
+    def doc_ids(self, paths: List[str]) -> List[int | None]:
+        ids = []
+        for path in paths:
+            try:
+                ids.append(self.doc_id(path))
+            except NameError:
+                ids.append(None)
+        return ids
+
+    def doc_path(self, id) -> str:
+        return self.paths[int(id)]
+
+    def doc_count(self) -> int:
+        return len(self.paths)
+
+    def generation(self) -> int:
+        """
+        Returns the generation of the index on disk, opening it again if it
+        has been rebuilt
+
+        :return:
+        """
+        generation = read_meta(self.index)["generation"]
+        if generation != self.meta["generation"]:
+            self.open()
+        return generation
+
+    def doc_freqs(self, terms: List[str]) -> List[int]:
+        """
+        Returns the number of documents that contain each term
+
+        :param terms:
+        :return:
+        """
+        freqs = []
+        for t in terms:
+            i = bisect_left(self.terms, t)
+            found = i < len(self.terms) and self.terms[i] == t
+            freqs.append(int(self.df[i]) if found else 0)
+        return freqs
+
+    def term_freqs(self, id) -> List[Tuple[str, int]]:
+        """
+        Returns the terms of a document and their frequencies, sorted by term
+
+        :param id:
+        :return:
+        """
+        a, b = self.indptr[int(id)], self.indptr[int(id) + 1]
+        terms = self.terms
+        return [
+            (terms[t], f) for t, f in zip(self.doc_terms[a:b], self.freqs[a:b].tolist())
+        ]
+
+    def term_vector(self, id) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """
+        Returns the term vector of a document as TFIDFViewer.document_term_vector
+
+        :param id:
+        :return:
+        """
+        a, b = self.indptr[int(id)], self.indptr[int(id) + 1]
+        ids = self.doc_terms[a:b]
+        words = [self.terms[t] for t in ids]
+        return (
+            list(zip(words, self.freqs[a:b].tolist())),
+            list(zip(words, self.df[ids].tolist())),
+        )
+
+    def stream_term_freqs(
+        self, hits: Iterable[Tuple[int, str]], stats=None
+    ) -> Iterator[Tuple[Tuple[int, str], List[Tuple[str, int]]]]:
+        """
+        Yields each hit with the term frequencies of its document, as
+        backends.ElasticBackend.stream_term_freqs
+
+        :param hits: (id, path) pairs, as yielded by scan
+        :param stats: not used, the document frequencies of a local index
+            are read directly from it
+        :return:
+        """
+        for hit in hits:
+            yield hit, self.term_freqs(hit[0])
+
+    def scan(self, slice_no: int = 0, slices: int = 1) -> Iterator[Tuple[int, str]]:
+        """
+        Yields the id and path of the documents of a slice of the index
+
+        :param slice_no:
+        :param slices:
+        :return:
+        """
+        n = len(self.paths)
+        for i in range(slice_no * n // slices, (slice_no + 1) * n // slices):
+            yield i, self.paths[i]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", required=True, default=None, help="Path to the files")
+    parser.add_argument(
+        "--index", required=True, default=None, help="Directory of the local index"
+    )
+    parser.add_argument(
+        "--token",
+        default="standard",
+        choices=list(TOKENIZERS),
+        help="Text tokenizer",
+    )
+    parser.add_argument(
+        "--filter",
+        default=["lowercase"],
+        choices=FILTERS,
+        nargs="*",
+        help="Text filters",
+    )
+    parser.add_argument(
+        "--nprocs",
+        type=int,
+        default=max(cpu_count() - 2, 2),
+        help="Number of processes analyzing the files",
+    )
+
+    args = parser.parse_args()
+
+    count = build_index(
+        args.index,
+        list(generate_files_list(args.path)),
+        Analyzer(args.token, args.filter),
+        args.nprocs,
+    )
+    print("Indexed:", count, file=sys.stderr)
@@ -10,6 +10,17 @@ TFIDFViewer
 
     Receives two paths of files to compare (the paths have to be the ones used when indexing the files)
 
+    The term vectors are read from Elasticsearch or from a local index (see backends)
+
+    With --store the vectors are read from a vector store of the index (see
+    VectorStore), which is built the first time
+
+    With --pairs (a CSV file of pairs of paths) or --paths (a file with a path
+    per line, all their pairs are compared) many files are compared in a
+    batch: the paths are resolved in bulk, each process keeps the vectors it
+    has computed in a cache of limited size, and the similarities are
+    written as CSV as they are computed, or as a matrix (--matrix, with --paths)
+
 :Authors:
     bejar
 
@@ -19,80 +30,95 @@ TFIDFViewer
 """
 
 import argparse
+import csv
+import sys
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool, cpu_count
 
 import numpy as np
-from elasticsearch import Elasticsearch
-from elasticsearch.client import CatClient
-from elasticsearch.exceptions import NotFoundError
-from elasticsearch_dsl import Search
-from elasticsearch_dsl.query import Q
+from backends import BACKENDS, INDEX_NOT_FOUND, CollectionStats, open_backend
+from VectorStore import VectorStore, open_store
 
 __author__ = "bejar"
 
 
-def search_file_by_path(client, index, path):
+def search_file_by_path(backend, path):
     """
     Search for a file using its path
 
+    :param backend:
     :param path:
     :return:
     """
-    s = Search(using=client, index=index)
-    q = Q("match", path=path)  # exact search in the path field
-    s = s.query(q)
-    result = s.scan()
+    return backend.doc_id(path)
 
-    try:
-        first = next(result)
-    except StopIteration:
-        raise NameError(f"File [{path}] not found")
 
-    return first.meta.id
-
-
-def document_term_vector(client, index, id):
+def document_term_vector(backend, id):
     """
     Returns the term vector of a document and its statistics a two sorted list of pairs (word, count)
     The first one is the frequency of the term in the document, the second one is the number of documents
     that contain the term
 
-    :param client:
-    :param index:
+    :param backend:
     :param id:
     :return:
     """
-    termvector = client.termvectors(
-        index=index, id=id, fields=["text"], positions=False, term_statistics=True
-    )
+    return backend.term_vector(id)
 
-    file_td = {}
-    file_df = {}
 
-    if "text" in termvector["term_vectors"]:
-        for t, data in termvector["term_vectors"]["text"]["terms"].items():
-            file_td[t] = data["term_freq"]
-            file_df[t] = data["doc_freq"]
-    return sorted(file_td.items()), sorted(file_df.items())
-
-
-def toTFIDF(client, index, file_id):
+def toTFIDF(backend, file_id, stats=None):
     """
     Returns the term weights of a document
 
-    :param file:
+    :param backend:
+    :param file_id:
+    :param stats: CollectionStats of the index, to reuse the number of documents
+        and the document frequencies between calls
     :return:
     """
 
     # Get the frequency of the term in the document, and the number of documents
     # that contain the term
-    file_tv, file_df = document_term_vector(client, index, file_id)
+    if stats is None:
+        file_tv, file_df = document_term_vector(backend, file_id)
+        return freqsToTFIDF(file_tv, [df for _, df in file_df], doc_count(backend))
+
+    # While the cache is cold the term vector is fetched once with its
+    # statistics, which are kept for the next documents. Once the documents
+    # only have cached terms, the statistics are served by stats and only the
+    # term frequencies are fetched.
+    if not stats.warm:
+        file_tv, file_df = document_term_vector(backend, file_id)
+        stats.has_doc_freqs([t for t, _ in file_tv])
+        stats.add_doc_freqs(file_df)
+        return freqsToTFIDF(file_tv, [df for _, df in file_df], stats.doc_count())
+
+    file_tv = backend.term_freqs(file_id)
+    terms = [t for t, _ in file_tv]
+    if stats.has_doc_freqs(terms):
+        return freqsToTFIDF(file_tv, stats.doc_freqs(terms), stats.doc_count())
+
+    # A term that is not cached yet cools the cache down
+    _, file_df = document_term_vector(backend, file_id)
+    stats.add_doc_freqs(file_df)
+    return freqsToTFIDF(file_tv, [df for _, df in file_df], stats.doc_count())
+
+
+def freqsToTFIDF(file_tv, file_df, dcount):
+    """
+    Returns the term weights of a document from its term frequencies
 
+    :param file_tv: sorted (term, frequency) pairs of the document
+    :param file_df: number of documents that contain each term
+    :param dcount: number of documents in the index
+    :return:
+    """
     max_freq = max(file_tv, key=lambda x: x[1])[1]
 
-    dcount = doc_count(client, index)
-
     tfidfw = []
-    for (t, w), (_, df) in zip(file_tv, file_df):
+    for (t, w), df in zip(file_tv, file_df):
         tf = w / max_freq
         idf = np.log(dcount / df)
         tfidfw.append((t, tf * idf))
@@ -149,49 +175,308 @@ def cosine_similarity(tw1, tw2):
         return sim
 
 
-def doc_count(client, index):
+def doc_count(backend):
     """
     Returns the number of documents in an index
 
-    :param client:
+    :param backend:
+    :return:
+    """
+    return backend.doc_count()
+
+
+CACHE_BYTES = 256 * 2**20  # memory of the vector caches of all the processes
+PAIRS_CHUNK = 1024  # pairs compared by a process at a time
+
+
+def vector_bytes(tw):
+    """
+    Returns the approximate memory used by a list of (term, weight) pairs
+
+    :param tw:
+    :return:
+    """
+    # each pair is a tuple (56 bytes) with a float (24 bytes) in a list
+    return sys.getsizeof(tw) + sum(sys.getsizeof(t) + 88 for t, _ in tw)
+
+
+class VectorCache:
+    """
+    Vectors of the documents used most recently, up to a number of bytes
+    """
+
+    def __init__(self, compute, budget=CACHE_BYTES):
+        self.compute = compute
+        self.budget = budget
+        self.used = 0
+        self.vectors = OrderedDict()
+
+    def get(self, id):
+        """
+        Returns the vector of a document, computing it if it is not cached
+
+        :param id:
+        :return:
+        """
+        if id in self.vectors:
+            self.vectors.move_to_end(id)
+            return self.vectors[id][0]
+
+        tw = list(self.compute(id))
+        size = vector_bytes(tw)
+        self.vectors[id] = (tw, size)
+        self.used += size
+        while self.used > self.budget and len(self.vectors) > 1:
+            _, (_, freed) = self.vectors.popitem(last=False)
+            self.used -= freed
+        return tw
+
+
+def batch_init(backend, index, store, ids, budget, stats):
+    global _cache, _ids
+    _ids = ids
+    if store:
+        _cache = VectorCache(VectorStore(store).term_weights, budget)
+    else:
+        backend = open_backend(backend, index)
+        _cache = VectorCache(
+            partial(toTFIDF, backend, stats=stats.bind(backend)), budget
+        )
+
+
+def compare_chunk(pairs):
+    """
+    Returns the similarity of pairs of documents, NaN if one is not indexed
+
+    :param pairs: positions in the list of paths of the batch
+    :return:
+    """
+    similarities = []
+    for i, j in pairs:
+        if _ids[i] is None or _ids[j] is None:
+            similarities.append(float("nan"))
+        else:
+            similarities.append(
+                cosine_similarity(_cache.get(_ids[i]), _cache.get(_ids[j]))
+            )
+    return similarities
+
+
+def compare_batch(
+    backend,
+    index,
+    paths,
+    pairs,
+    store=None,
+    nprocs=max(cpu_count() - 1, 1),
+    budget=CACHE_BYTES,
+):
+    """
+    Yields the similarity of each pair of files, in order
+
+    :param backend:
     :param index:
+    :param paths: paths of the files
+    :param pairs: pairs of positions in paths
+    :param store: directory of a vector store to read the vectors from
+    :param nprocs:
+    :param budget: bytes of the vector caches of all the processes
     :return:
     """
-    return int(CatClient(client).count(index=[index], format="json")[0]["count"])
+    stats = None
+    if store:
+        vectors = open_store(store, backend, index)
+        ids = []
+        for path in paths:
+            try:
+                ids.append(vectors.doc_row(path))
+            except NameError:
+                ids.append(None)
+    else:
+        store_backend = open_backend(backend, index)
+        ids = store_backend.doc_ids(paths)
+        stats = CollectionStats(store_backend)
+        stats.doc_count()
+
+    for path, id in zip(paths, ids):
+        if id is None:
+            print(f"File [{path}] not found", file=sys.stderr)
+
+    # The chunks are sent a few at a time, so the pairs are never all in memory
+    pairs = iter(pairs)
+    chunks = iter(lambda: list(islice(pairs, PAIRS_CHUNK)), [])
+    with Pool(
+        nprocs,
+        initializer=batch_init,
+        initargs=(backend, index, store, ids, budget // nprocs, stats),
+    ) as pool:
+        while window := list(islice(chunks, 4 * nprocs)):
+            for chunk, similarities in zip(window, pool.map(compare_chunk, window)):
+                yield from zip(chunk, similarities)
+
+
+def read_pairs(file):
+    """
+    Reads a CSV file with a pair of paths per line, as the first two columns.
+    A first line path1,path2 (the header of the output) is skipped, and a
+    line without two paths raises a ValueError with its line number.
+
+    :param file:
+    :return: the paths and the pairs of positions in the paths
+    """
+    positions = {}
+    pairs = []
+    with open(file, newline="") as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if not row:
+                continue
+            first = [p.strip() for p in row[:2]]
+            if not pairs and first == ["path1", "path2"]:
+                continue
+            if len(first) < 2 or not all(first):
+                raise ValueError(f"{file}, line {reader.line_num}: expected two paths")
+            pairs.append(tuple(positions.setdefault(p, len(positions)) for p in first))
+    return list(positions), pairs
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--index", default=None, required=True, help="Index to search")
     parser.add_argument(
-        "--files",
+        "--index",
         default=None,
         required=True,
+        help="Index to search (directory of the index with --backend local)",
+    )
+    parser.add_argument(
+        "--backend",
+        default="elasticsearch",
+        choices=BACKENDS,
+        help="Where the term vectors are read from",
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "--files",
+        default=None,
         nargs=2,
         help="Paths of the files to compare",
     )
+    group.add_argument(
+        "--pairs",
+        default=None,
+        help="CSV file with the pairs of paths of the files to compare",
+    )
+    group.add_argument(
+        "--paths",
+        default=None,
+        help="File with the paths of the files to compare, one per line",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="CSV file of the similarities of --pairs or --paths (default stdout)",
+    )
+    parser.add_argument(
+        "--matrix",
+        default=None,
+        help="Save the similarities of --paths as a matrix in this .npy file",
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=int,
+        default=CACHE_BYTES // 2**20,
+        help="Memory of the vector caches of the batch, in MB",
+    )
+    parser.add_argument(
+        "--nproc",
+        type=int,
+        default=max(cpu_count() - 1, 1),
+        help="Number of processes comparing the batch",
+    )
     parser.add_argument(
         "--print", default=False, action="store_true", help="Print TFIDF vectors"
     )
+    parser.add_argument(
+        "--store",
+        default=None,
+        help="Directory of the vector store of the index, built if it is not up to date",
+    )
 
     args = parser.parse_args()
 
     index = args.index
 
+    if args.matrix and not args.paths:
+        parser.error("--matrix needs --paths")
+
+    if args.pairs or args.paths:
+        if args.pairs:
+            try:
+                paths, pairs = read_pairs(args.pairs)
+            except ValueError as e:
+                parser.error(str(e))
+        else:
+            with open(args.paths) as f:
+                paths = [line.strip() for line in f if line.strip()]
+            n = len(paths)
+            # Self pairs are only compared for the diagonal of the matrix
+            start = 0 if args.matrix else 1
+            pairs = ((i, j) for i in range(n) for j in range(i + start, n))
+
+        try:
+            results = compare_batch(
+                args.backend,
+                index,
+                paths,
+                pairs,
+                args.store,
+                args.nproc,
+                args.cache_mb * 2**20,
+            )
+
+            if args.matrix:
+                matrix = np.empty((len(paths), len(paths)), dtype=np.float32)
+                for (i, j), similarity in results:
+                    matrix[i, j] = matrix[j, i] = similarity
+                np.save(args.matrix, matrix)
+            else:
+                out = open(args.output, "w", newline="") if args.output else sys.stdout
+                writer = csv.writer(out)
+                writer.writerow(["path1", "path2", "similarity"])
+                for (i, j), similarity in results:
+                    writer.writerow([paths[i], paths[j], f"{similarity:.5f}"])
+                if args.output:
+                    out.close()
+        except INDEX_NOT_FOUND:
+            print(f"Index {index} does not exists")
+        sys.exit(0)
+
     file1 = args.files[0]
     file2 = args.files[1]
 
-    client = Elasticsearch(timeout=1000)
-
     try:
+        if args.store:
+            vectors = open_store(args.store, args.backend, index)
+
+            # Get the rows of the files, the vectors are already computed
+            file1_row = vectors.doc_row(file1)
+            file2_row = vectors.doc_row(file2)
+
+            file1_tw = vectors.term_weights(file1_row)
+            file2_tw = vectors.term_weights(file2_row)
+            similarity = vectors.cosine(file1_row, file2_row)
+        else:
+            backend = open_backend(args.backend, index)
+            stats = CollectionStats(backend)
 
-        # Get the files ids
-        file1_id = search_file_by_path(client, index, file1)
-        file2_id = search_file_by_path(client, index, file2)
+            # Get the files ids
+            file1_id = search_file_by_path(backend, file1)
+            file2_id = search_file_by_path(backend, file2)
 
-        # Compute the TF-IDF vectors
-        file1_tw = list(toTFIDF(client, index, file1_id))
-        file2_tw = list(toTFIDF(client, index, file2_id))
+            # Compute the TF-IDF vectors
+            file1_tw = list(toTFIDF(backend, file1_id, stats))
+            file2_tw = list(toTFIDF(backend, file2_id, stats))
+            similarity = cosine_similarity(file1_tw, file2_tw)
 
         if args.print:
             print(f"TFIDF FILE {file1}")
@@ -201,7 +486,7 @@ if __name__ == "__main__":
             print_term_weigth_vector(file2_tw)
             print("---------------------")
 
-        print(f"Similarity = {cosine_similarity(file1_tw, file2_tw):3.5f}")
+        print(f"Similarity = {similarity:3.5f}")
 
-    except NotFoundError:
+    except INDEX_NOT_FOUND:
         print(f"Index {index} does not exists")
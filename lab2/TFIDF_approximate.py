@@ -0,0 +1,807 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: TFIDF_approximate
+
+TFIDF_approximate
+******
+
+:Description: TFIDF_approximate
+
+    Approximate version of TFIDF_experiment: finds the documents most similar
+    to a file with locality sensitive hashing of the TF-IDF vectors of a
+    vector store (see VectorStore)
+
+    The signature of a document has one bit per random hyperplane, the sign
+    of the projection of its vector (signed random projections), so the
+    fraction of different bits of two signatures estimates the angle between
+    the vectors. The hyperplane coordinate of a term is derived from a hash
+    of the term, so it does not depend on the term ids of the store.
+
+    The signed vectors do not depend on the size of the collection: their
+    weights are the tf / max tf of the store (recovered from its weights and
+    document frequencies) times an idf frozen the first time a term is seen.
+    Adding documents changes every TF-IDF weight of the store, but only
+    changes the signed vectors of the documents that changed themselves.
+
+    The signatures directory (--signatures) holds:
+
+    meta.json: number of bits, bytes per band and seed of the hyperplanes
+    paths.txt: path of the document of each signature, in the order added
+    signatures.bin: packed signatures, bits / 8 bytes each
+    digests.bin: digest of the vector each signature was computed from,
+        8 bytes each
+    idf_terms.txt, idf.bin: the frozen idf of each term, a float64 each
+    buckets.npy, band_keys.npy: the bucket tables of the bands (see below)
+
+    Every run adds the signatures of the documents of the store that do not
+    have one yet, and signs again the documents whose vector has changed
+    (its digest is not the recorded one), so the signatures are built
+    incrementally as documents are indexed. The digest rounds the tf / max
+    tf to RATIO_LEVELS levels, so the rounding error of the stored weights
+    does not change it. The rows are signed in batches of SIGN_BATCH, each
+    written as soon as it is computed.
+
+    The signatures are split in bands of --band-bytes bytes: buckets.npy
+    holds, for each band, the signatures sorted by their value of that band,
+    and band_keys.npy those values, sorted, so a bucket is found with a
+    binary search. The candidates of a query are the documents that share at
+    least one band with it, as documents at a small angle agree on whole
+    bands much more often than unrelated ones: an unrelated document is in a
+    bucket of a band with probability 2^-(8 * band bytes). More bits mean
+    more bands, so more candidates and a higher recall, and wider bands fewer
+    candidates. --probe also visits the buckets one bit away in every band,
+    for documents at larger angles. The candidates with the closest
+    signatures (Hamming distance) are ranked by their exact cosine
+    similarity. The signatures and the tables are memory-mapped, so a query
+    only reads its buckets.
+
+    On a 3100-document index whose nearest neighbours have a cosine of about
+    0.34, recall@10 and query time against 26 ms for the exact
+    VectorStore.top_k (share of the index that are candidates in brackets):
+
+    --bits 512 --band-bytes 1 (default): 0.73, 5.7 ms (23%)
+        with --probe: 0.98, 14.6 ms (91%)
+    --bits 256 --band-bytes 1: 0.53, 3.9 ms (13%)
+        with --probe: 0.97, 9.6 ms (70%)
+    --bits 2048 --band-bytes 2: 0.15, 8.3 ms (0.3%)
+        with --probe: 0.49, 29.4 ms (3.9%)
+
+    Wider bands only pay off for documents much closer than these, such as
+    near duplicates.
+
+    --recall compares the results with the exact top k of the store
+
+:Version:
+
+:Date:  18/10/2026
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from functools import partial
+from heapq import nlargest
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from backends import BACKENDS, INDEX_NOT_FOUND
+from scipy import sparse
+from VectorStore import VectorStore, open_store
+
+BITS = 512  # bits of the signatures
+MAX_BITS = 4096  # longest signatures
+BAND_BYTES = 1  # bytes of the signatures in each band, at most 8
+CANDIDATES = 1000  # documents re-ranked by their exact similarity
+SIGN_BATCH = 10000  # rows signed at a time
+PLANE_BYTES = 8  # bytes of the hyperplanes unpacked at a time
+RATIO_LEVELS = 256  # levels of the tf / max tf in the digests
+
+DISTANCE_CHUNK = 65536  # signatures compared with a query at a time
+
+# Number of bits set in each byte
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(
+    axis=1, dtype=np.uint8
+)
+
+
+def term_planes(terms: List[str], bits: int, seed: int) -> np.ndarray:
+    """
+    Returns the packed coordinates of the terms in each random hyperplane, a
+    set bit is +1 and a clear one -1
+
+    :param terms:
+    :param bits:
+    :param seed:
+    :return: a len(terms) x bits / 8 matrix of bytes
+    """
+    # blake2b digests have up to 64 bytes, longer planes join several
+    salt = seed.to_bytes(8, "little")
+    sizes = [min(64, bits // 8 - lo) for lo in range(0, bits // 8, 64)]
+    digests = b"".join(
+        hashlib.blake2b(
+            t.encode("utf-8"),
+            digest_size=size,
+            salt=salt,
+            person=part.to_bytes(8, "little"),
+        ).digest()
+        for t in terms
+        for part, size in enumerate(sizes)
+    )
+    return np.frombuffer(digests, dtype=np.uint8).reshape(len(terms), bits // 8)
+
+
+def store_idf(vectors: VectorStore) -> np.ndarray:
+    """
+    Returns the idf of each term of a vector store, log(N / df) as in
+    VectorStore.build_store
+
+    :param vectors:
+    :return:
+    """
+    df = np.diff(np.asarray(vectors.postings_indptr))
+    return np.log(len(vectors) / np.maximum(df, 1))
+
+
+def tf_ratios(X: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+    """
+    Returns the tf / max tf of some rows of a vector store, dividing their
+    weights by the idf of the store and scaling every row to a maximum of 1.
+    Terms that are in every document have a weight of 0, so they are dropped.
+
+    :param X: rows of the matrix of the store (see VectorStore.matrix)
+    :param idf: idf of the store (see store_idf)
+    :return:
+    """
+    X = sparse.csr_matrix(
+        (np.array(X.data, dtype=np.float64), np.array(X.indices), np.array(X.indptr)),
+        shape=X.shape,
+    )
+    known = idf[X.indices] > 0
+    X.data[known] /= idf[X.indices[known]]
+    X.data[~known] = 0
+    X.eliminate_zeros()
+    peaks = X.max(axis=1).toarray().ravel()
+    return sparse.diags(1 / np.where(peaks > 0, peaks, 1)) @ X
+
+
+def sign_rows(
+    vectors: VectorStore,
+    rows: np.ndarray,
+    planes: Callable[[np.ndarray], np.ndarray],
+    idf: np.ndarray,
+    frozen: np.ndarray,
+    batch_size: int = SIGN_BATCH,
+) -> Iterator[np.ndarray]:
+    """
+    Yields the packed signatures of some rows of a vector store, batch_size
+    rows at a time. The hyperplanes are unpacked PLANE_BYTES at a time, so
+    their memory depends on the number of terms of a batch but not on the
+    bits of the signatures.
+
+    :param vectors:
+    :param rows:
+    :param planes: returns the packed hyperplanes of some term ids (see
+        term_planes)
+    :param idf: idf of the store (see store_idf)
+    :param frozen: frozen idf of each term of the store
+    :param batch_size:
+    :return: len(batch) x bits / 8 matrices of bytes, one per batch of rows
+    """
+    X = vectors.matrix()
+    for lo in range(0, len(rows), batch_size):
+        batch = tf_ratios(X[rows[lo : lo + batch_size]], idf)
+        batch.data *= frozen[batch.indices]
+        used = np.unique(batch.indices)
+        batch = batch[:, used]
+        packed = planes(used)
+        signatures = np.empty((batch.shape[0], packed.shape[1]), dtype=np.uint8)
+        for a in range(0, packed.shape[1], PLANE_BYTES):
+            chunk = np.unpackbits(packed[:, a : a + PLANE_BYTES], axis=1)
+            projections = batch @ (chunk.astype(np.float32) * 2 - 1)
+            signatures[:, a : a + PLANE_BYTES] = np.packbits(projections >= 0, axis=1)
+        yield signatures
+
+
+def row_digests(vectors: VectorStore, idf: np.ndarray) -> np.ndarray:
+    """
+    Returns a digest of the tf / max tf of each row of a vector store, of its
+    terms and rounded ratios, that does not depend on the term ids of the
+    store nor on the document frequencies
+
+    :param vectors:
+    :param idf: idf of the store (see store_idf)
+    :return: a uint64 per row
+    """
+    terms = np.frombuffer(
+        b"".join(
+            hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest()
+            for t in vectors.terms
+        ),
+        dtype=np.uint64,
+    )
+    X = tf_ratios(vectors.matrix(), idf)
+    levels = np.rint(X.data * RATIO_LEVELS).astype(np.uint64)
+    entries = terms[X.indices] ^ levels * np.uint64(0x9E3779B97F4A7C15)
+    entries *= np.uint64(0xFF51AFD7ED558CCD)
+    entries ^= entries >> np.uint64(33)
+
+    # The entries of a row are summed, as its terms are unique
+    digests = np.zeros(len(vectors), dtype=np.uint64)
+    lengths = np.diff(X.indptr)
+    starts = X.indptr[:-1][lengths > 0]  # reduceat skips empty rows
+    digests[lengths > 0] = np.add.reduceat(entries, starts)
+    return digests
+
+
+def band_keys(packed: np.ndarray, band: int, width: int) -> np.ndarray:
+    """
+    Returns the value of a band of some packed signatures, its bytes read as
+    a big-endian integer
+
+    :param packed: len(signatures) x bytes matrix
+    :param band:
+    :param width: bytes per band
+    :return:
+    """
+    keys = np.zeros(len(packed), dtype=np.uint64)
+    for byte in range(band * width, (band + 1) * width):
+        keys <<= np.uint64(8)
+        keys |= packed[:, byte]
+    return keys
+
+
+class Signatures:
+    """
+    File of signatures, keyed by the path of the documents
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        bits: int = BITS,
+        seed: int = 0,
+        band_bytes: int = BAND_BYTES,
+    ):
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            if bits % 8 or not 8 <= bits <= MAX_BITS:
+                raise ValueError(
+                    f"The signatures have a multiple of 8 bits, up to {MAX_BITS}"
+                )
+            if not 1 <= band_bytes <= 8 or (bits // 8) % band_bytes:
+                raise ValueError(
+                    "The bands have up to 8 bytes and divide the signatures"
+                )
+            os.makedirs(directory, exist_ok=True)
+            meta = {"bits": bits, "seed": seed, "band_bytes": band_bytes}
+            with open(os.path.join(directory, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            for name in ["paths.txt", "idf_terms.txt"]:
+                open(os.path.join(directory, name), "w").close()
+            for name in ["signatures.bin", "digests.bin", "idf.bin"]:
+                open(os.path.join(directory, name), "wb").close()
+
+        self.bits = meta["bits"]
+        self.seed = meta["seed"]
+        self.band_bytes = meta.get("band_bytes", 1)  # older directories
+        self.load()
+
+    def load(self):
+        with open(os.path.join(self.directory, "paths.txt"), encoding="utf-8") as f:
+            self.paths = f.read().splitlines()
+        shape = (len(self.paths), self.bits // 8)
+        if self.paths:
+            self.packed = np.memmap(
+                os.path.join(self.directory, "signatures.bin"),
+                dtype=np.uint8,
+                mode="r",
+                shape=shape,
+            )
+        else:
+            self.packed = np.zeros(shape, dtype=np.uint8)
+
+        # A frozen idf is written before its term, so extra values of an
+        # interrupted update are dropped
+        try:
+            with open(
+                os.path.join(self.directory, "idf_terms.txt"), encoding="utf-8"
+            ) as f:
+                self.idf_terms = f.read().splitlines()
+            self.idf_values = np.fromfile(
+                os.path.join(self.directory, "idf.bin"), dtype=np.float64
+            )[: len(self.idf_terms)]
+        except FileNotFoundError:  # older directories
+            self.idf_terms, self.idf_values = [], np.zeros(0)
+
+        # The tables are built again if an update was interrupted before
+        # writing them
+        bands = self.bits // 8 // self.band_bytes
+        try:
+            self.buckets = np.load(
+                os.path.join(self.directory, "buckets.npy"), mmap_mode="r"
+            )
+            self.keys = np.load(
+                os.path.join(self.directory, "band_keys.npy"), mmap_mode="r"
+            )
+            built = self.buckets.shape == self.keys.shape == (bands, len(self.paths))
+        except FileNotFoundError:
+            built = False
+        if not built:
+            self.build_buckets()
+
+        self.rows = None
+        self.rows_store = None
+        self.idf = None
+        self.frozen = None
+        self.idf_store = None
+        self.planes = None
+        self.hashed = None
+        self.planes_store = None
+
+    def build_buckets(self):
+        """
+        Writes the bucket tables of the bands, sorting the signatures by the
+        value of each band
+        """
+        width, n = self.band_bytes, len(self.paths)
+        bands = self.bits // 8 // width
+        dtype = np.uint16 if width <= 2 else np.uint32 if width <= 4 else np.uint64
+        tmp = os.path.join(self.directory, f"buckets.tmp{os.getpid()}.npy")
+        buckets = np.lib.format.open_memmap(
+            tmp, mode="w+", dtype=np.int32, shape=(bands, n)
+        )
+        tmp_keys = os.path.join(self.directory, f"band_keys.tmp{os.getpid()}.npy")
+        keys = np.lib.format.open_memmap(
+            tmp_keys, mode="w+", dtype=dtype, shape=(bands, n)
+        )
+        for band in range(bands):
+            values = band_keys(self.packed, band, width)
+            order = np.argsort(values, kind="stable")
+            buckets[band] = order
+            keys[band] = values[order]
+        buckets.flush()
+        keys.flush()
+        del buckets, keys
+
+        # The tables are only used when their size matches the signatures
+        os.replace(tmp_keys, os.path.join(self.directory, "band_keys.npy"))
+        os.replace(tmp, os.path.join(self.directory, "buckets.npy"))
+        self.buckets = np.load(
+            os.path.join(self.directory, "buckets.npy"), mmap_mode="r"
+        )
+        self.keys = np.load(
+            os.path.join(self.directory, "band_keys.npy"), mmap_mode="r"
+        )
+
+    def store_rows(self, vectors: VectorStore) -> np.ndarray:
+        """
+        Returns the row in the store of the document of each signature, -1
+        if it is no longer in the store
+
+        :param vectors:
+        :return:
+        """
+        if self.rows_store is not vectors:
+            self.rows = np.full(len(self.paths), -1, dtype=np.int64)
+            for i, path in enumerate(self.paths):
+                try:
+                    self.rows[i] = vectors.doc_row(path)
+                except NameError:
+                    pass
+            self.rows_store = vectors
+        return self.rows
+
+    def store_weights(self, vectors: VectorStore) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the idf of each term of the store and its frozen idf, the
+        idf of the store the first time the term was signed. Terms that have
+        not been signed yet are frozen with their current idf.
+
+        :param vectors:
+        :return:
+        """
+        if self.idf_store is not vectors:
+            self.idf = store_idf(vectors)
+            positions = {t: i for i, t in enumerate(self.idf_terms)}
+            frozen = np.array(
+                [positions.get(t, -1) for t in vectors.terms], dtype=np.int64
+            )
+            new = np.flatnonzero(frozen < 0)
+            if len(new):
+                with open(os.path.join(self.directory, "idf.bin"), "r+b") as f:
+                    f.truncate(len(self.idf_terms) * 8)
+                    f.seek(0, os.SEEK_END)
+                    f.write(self.idf[new].astype(np.float64).tobytes())
+                with open(
+                    os.path.join(self.directory, "idf_terms.txt"),
+                    "a",
+                    encoding="utf-8",
+                ) as f:
+                    f.writelines(vectors.terms[t] + "\n" for t in new)
+                frozen[new] = np.arange(len(new)) + len(self.idf_terms)
+                self.idf_terms += [vectors.terms[t] for t in new]
+                self.idf_values = np.concatenate([self.idf_values, self.idf[new]])
+            self.frozen = self.idf_values[frozen]
+            self.idf_store = vectors
+        return self.idf, self.frozen
+
+    def store_planes(self, vectors: VectorStore, terms: np.ndarray) -> np.ndarray:
+        """
+        Returns the packed hyperplanes of some terms of the store (see
+        term_planes). They are kept for the next batches and queries, so the
+        terms are hashed once.
+
+        :param vectors:
+        :param terms: term ids of the store
+        :return:
+        """
+        if self.planes_store is not vectors:
+            self.planes = np.zeros((len(vectors.terms), self.bits // 8), np.uint8)
+            self.hashed = np.zeros(len(vectors.terms), dtype=bool)
+            self.planes_store = vectors
+        missing = terms[~self.hashed[terms]]
+        if len(missing):
+            self.planes[missing] = term_planes(
+                [vectors.terms[t] for t in missing], self.bits, self.seed
+            )
+            self.hashed[missing] = True
+        return self.planes[terms]
+
+    def sign(self, vectors: VectorStore, rows: np.ndarray) -> Iterator[np.ndarray]:
+        """
+        Yields the packed signatures of some rows of the store, in batches
+        (see sign_rows)
+
+        :param vectors:
+        :param rows:
+        :return:
+        """
+        idf, frozen = self.store_weights(vectors)
+        return sign_rows(
+            vectors, rows, partial(self.store_planes, vectors), idf, frozen
+        )
+
+    def update(self, vectors: VectorStore) -> Tuple[int, int]:
+        """
+        Adds the signatures of the documents of the store that do not have
+        one, and signs again the documents whose vector has changed
+
+        :param vectors:
+        :return: the number of signatures added and signed again
+        """
+        idf, _ = self.store_weights(vectors)
+        digests = row_digests(vectors, idf)
+        rows = self.store_rows(vectors)
+
+        # Signatures without a digest (older directories) are signed again
+        recorded = np.zeros(len(self.paths), dtype=np.uint64)
+        try:
+            stored = np.fromfile(
+                os.path.join(self.directory, "digests.bin"), dtype=np.uint64
+            )[: len(self.paths)]
+            recorded[: len(stored)] = stored
+        except FileNotFoundError:
+            pass
+        changed = np.flatnonzero(rows >= 0)
+        changed = changed[recorded[changed] != digests[rows[changed]]]
+        known = set(self.paths)
+        new = np.array(
+            [row for row, path in enumerate(vectors.paths) if path not in known],
+            dtype=np.int64,
+        )
+        if not len(changed) and not len(new):
+            return 0, 0
+
+        # The bucket tables are removed first and built again at the end, so
+        # an interrupted update never leaves tables of other signatures
+        try:
+            os.remove(os.path.join(self.directory, "buckets.npy"))
+        except FileNotFoundError:
+            pass
+
+        # Changed signatures are overwritten in place and new ones appended,
+        # each batch as soon as it is signed. A signature is written before
+        # its digest, and both before the path of a new one, so an
+        # interrupted update only leaves signatures that are signed again or
+        # ignored
+        width = self.bits // 8
+        total = len(self.paths) + len(new)
+        for name, size in [("signatures.bin", width), ("digests.bin", 8)]:
+            with open(os.path.join(self.directory, name), "a+b") as f:
+                f.truncate(total * size)
+        packed = np.memmap(
+            os.path.join(self.directory, "signatures.bin"),
+            dtype=np.uint8,
+            mode="r+",
+            shape=(total, width),
+        )
+        stored = np.memmap(
+            os.path.join(self.directory, "digests.bin"),
+            dtype=np.uint64,
+            mode="r+",
+            shape=(total,),
+        )
+
+        positions = np.concatenate([changed, np.arange(len(self.paths), total)]).astype(
+            np.int64
+        )
+        signed = np.concatenate([rows[changed], new]).astype(np.int64)
+        lo = 0
+        for batch in self.sign(vectors, signed):
+            hi = lo + len(batch)
+            packed[positions[lo:hi]] = batch
+            packed.flush()
+            stored[positions[lo:hi]] = digests[signed[lo:hi]]
+            stored.flush()
+            lo = hi
+        del packed, stored
+
+        with open(
+            os.path.join(self.directory, "paths.txt"), "a", encoding="utf-8"
+        ) as f:
+            f.writelines(vectors.paths[row] + "\n" for row in new)
+
+        self.load()
+        return len(new), len(changed)
+
+    def candidates(self, signature: np.ndarray, probe: bool = False) -> np.ndarray:
+        """
+        Returns the signatures that share at least one band with a
+        signature
+
+        :param signature: packed signature
+        :param probe: also take the signatures one bit away in a band
+        :return: sorted positions of the signatures
+        """
+        width = self.band_bytes
+        keys = [
+            (band, int(band_keys(signature[None, :], band, width)[0]))
+            for band in range(len(self.buckets))
+        ]
+        if probe:
+            keys += [
+                (band, key ^ 1 << bit) for band, key in keys for bit in range(8 * width)
+            ]
+        found = []
+        for band, key in keys:
+            table = self.keys[band]
+            key = table.dtype.type(key)
+            lo = np.searchsorted(table, key, side="left")
+            hi = np.searchsorted(table, key, side="right")
+            if lo < hi:
+                found.append(self.buckets[band, lo:hi])
+        return np.unique(np.concatenate(found)) if found else np.array([], np.int32)
+
+    def distances(self, signature: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """
+        Returns the Hamming distance of some signatures to a signature
+
+        :param signature:
+        :param positions: positions of the signatures
+        :return:
+        """
+        distances = np.empty(len(positions), dtype=np.int64)
+        for lo in range(0, len(positions), DISTANCE_CHUNK):
+            chunk = self.packed[positions[lo : lo + DISTANCE_CHUNK]]
+            distances[lo : lo + DISTANCE_CHUNK] = POPCOUNT[
+                np.bitwise_xor(chunk, signature)
+            ].sum(axis=1, dtype=np.int64)
+        return distances
+
+
+def approximate_top_k(
+    vectors: VectorStore,
+    signatures: Signatures,
+    row: int,
+    k: int,
+    ignore: Iterable[Tuple[int, int]] = (),
+    candidates: int = CANDIDATES,
+    probe: bool = False,
+) -> List[Tuple[float, int]]:
+    """
+    Returns the k rows most similar to a row of the store among the
+    candidates (documents that share a band with it) with the closest
+    signatures, with their cosine similarity
+
+    :param vectors:
+    :param signatures:
+    :param row:
+    :param k:
+    :param ignore: ranges of rows that are not candidates (see
+        VectorStore.prefix_rows)
+    :param candidates: number of candidates
+    :param probe: also take the documents one bit away in a band (see
+        Signatures.candidates)
+    :return:
+    """
+    signature = next(signatures.sign(vectors, np.array([row])))[0]
+
+    # The ignored documents and the ones no longer in the store are never
+    # candidates
+    positions = signatures.candidates(signature, probe)
+    rows = signatures.store_rows(vectors)[positions]
+    excluded = rows < 0
+    for lo, hi in ignore:
+        excluded |= (lo <= rows) & (rows < hi)
+    positions = positions[~excluded]
+
+    candidates = min(candidates, len(positions))
+    if not candidates:
+        return []
+    distances = signatures.distances(signature, positions)
+    closest = positions[np.argpartition(distances, candidates - 1)[:candidates]]
+
+    rows = signatures.store_rows(vectors)[closest]
+
+    terms, weights = vectors.vector(row)
+    query = np.zeros(len(vectors.terms))
+    query[terms] = weights
+    scores = vectors.matrix()[rows] @ query
+    return nlargest(k, zip(scores.tolist(), rows.tolist()))
+
+
+def recall(approximate: List[Tuple[float, int]], exact: List[Tuple[float, int]]):
+    """
+    Fraction of the exact results that are in the approximate ones
+
+    :param approximate:
+    :param exact:
+    :return:
+    """
+    if not exact:
+        return 1.0
+    return len({r for _, r in approximate} & {r for _, r in exact}) / len(exact)
+
+
+def main(
+    index: str,
+    path: str | None,
+    n: int,
+    ignore_paths: List[str],
+    backend: str,
+    store: str,
+    signatures: str,
+    bits: int = BITS,
+    candidates: int = CANDIDATES,
+    show_recall: bool = False,
+    evaluate: int = 0,
+    probe: bool = False,
+    band_bytes: int = BAND_BYTES,
+):
+    vectors = open_store(store, backend, index)
+    sigs = Signatures(signatures, bits, band_bytes=band_bytes)
+    added, changed = sigs.update(vectors)
+    print(
+        f"Signatures: {len(sigs.paths)} ({added} new, {changed} signed again)",
+        file=sys.stderr,
+    )
+
+    ignore = [vectors.prefix_rows(p) for p in ignore_paths]
+
+    if path is not None:
+        row = vectors.doc_row(path)
+        print("Original file:", vectors.doc_id(row), path, sep="\t", file=sys.stderr)
+
+        results = approximate_top_k(vectors, sigs, row, n, ignore, candidates, probe)
+        for score, result in results:
+            print(score, vectors.doc_id(result), end="\t", sep="\t")
+            print(vectors.doc_path(result))
+
+        if show_recall:
+            exact = vectors.top_k(vectors.vector(row), n, ignore)
+            print(f"Recall@{n}: {recall(results, exact):.3f}", file=sys.stderr)
+
+    if evaluate:
+        # Mean recall and query time over random documents of the store
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(vectors), min(evaluate, len(vectors)), replace=False)
+        recalls, times = [], []
+        for row in rows:
+            time1 = time.perf_counter()
+            results = approximate_top_k(
+                vectors, sigs, row, n, ignore, candidates, probe
+            )
+            times.append(time.perf_counter() - time1)
+            exact = vectors.top_k(vectors.vector(row), n, ignore)
+            recalls.append(recall(results, exact))
+        print(f"Mean recall@{n} over {len(rows)} documents: {np.mean(recalls):.3f}")
+        print(f"Mean query time: {np.mean(times) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search for the files most similar to a file, approximately"
+    )
+    parser.add_argument("--index", type=str, help="index to search in")
+    parser.add_argument(
+        "--backend",
+        default="elasticsearch",
+        choices=BACKENDS,
+        help="Where the term vectors are read from",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        required=True,
+        help="vector store of the index, built if it is not up to date",
+    )
+    parser.add_argument(
+        "--signatures",
+        type=str,
+        required=True,
+        help="directory of the signatures, updated with the new documents",
+    )
+    parser.add_argument("path", type=str, nargs="?", help="path of the file to search")
+    parser.add_argument(
+        "--ignore-paths",
+        type=str,
+        help="ignore paths containing this strings",
+        nargs="+",
+        default=[],
+    )
+    parser.add_argument("-n", type=int, default=10, help="number of results to return")
+    parser.add_argument(
+        "--bits",
+        type=int,
+        default=BITS,
+        help="bits of the signatures, when they are created",
+    )
+    parser.add_argument(
+        "--band-bytes",
+        type=int,
+        default=BAND_BYTES,
+        help="bytes of the signatures in each band, when they are created",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=CANDIDATES,
+        help="number of documents re-ranked by their exact similarity",
+    )
+    parser.add_argument(
+        "--recall",
+        action="store_true",
+        help="report the recall of the results against the exact search",
+    )
+    parser.add_argument(
+        "--evaluate",
+        type=int,
+        default=0,
+        help="report the mean recall over this number of random documents",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="also take as candidates the documents one bit away in a band: "
+        "higher recall, but about 8 * band bytes + 1 times more candidates",
+    )
+    args = parser.parse_args()
+
+    try:
+        main(
+            args.index,
+            args.path,
+            args.n,
+            args.ignore_paths,
+            args.backend,
+            args.store,
+            args.signatures,
+            args.bits,
+            args.candidates,
+            args.recall,
+            args.evaluate,
+            args.probe,
+            args.band_bytes,
+        )
+    except INDEX_NOT_FOUND:
+        print("Not found", file=sys.stderr)
+        sys.exit(1)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import argparse
 import sys
 from functools import partial
@@ -8,17 +10,18 @@ from itertools import chain
 from multiprocessing import Pool, cpu_count
 from typing import List, Tuple
 
-from elasticsearch import Elasticsearch
-from elasticsearch.exceptions import NotFoundError
-from elasticsearch_dsl import Q, Search
-from TFIDFViewer import cosine_similarity, search_file_by_path, toTFIDF
+from backends import BACKENDS, INDEX_NOT_FOUND, CollectionStats, open_backend
+from TFIDFViewer import cosine_similarity, freqsToTFIDF, search_file_by_path, toTFIDF
+from VectorStore import open_store
 
 
 # Theoretically, Elasticsearch client should be thread-safe, but sometimes
-# it throws an exception. So we create a new client for each worker instead.
-def worker_init(*args, **kwargs):
-    global _client
-    _client = Elasticsearch(*args, **kwargs)
+# it throws an exception. So we open the backend again in each worker instead.
+# The collection statistics fetched by the main process are shared with them.
+def worker_init(backend: str, index: str, stats: CollectionStats):
+    global _backend, _stats
+    _backend = open_backend(backend, index)
+    _stats = stats.bind(_backend)
 
 
 class Slicer:
@@ -32,42 +35,75 @@ class Slicer:
         self.ignore_paths = ignore_paths
 
     def process_slice(self, slice_no: int) -> List[Tuple[float, str]]:
-        global client
-        sc = (
-            Search(using=_client, index=self.index)
-            .query("match_all")
-            .extra(slice={"id": slice_no, "max": self.slices})
-            .scan()
-        )
+        sc = _backend.scan(slice_no, self.slices)
 
         def filter_path(hit):
             for path in self.ignore_paths:
-                if hit.path.startswith(path):
+                if hit[1].startswith(path):
                     return False
             return True
 
-        doc_ids = filter(filter_path, sc)
+        hits = filter(filter_path, sc)
 
-        doc_ids = map(lambda f: f.meta.id, doc_ids)
+        def tfidf(file_tv):
+            file_df = _stats.doc_freqs([t for t, _ in file_tv])
+            return freqsToTFIDF(file_tv, file_df, _stats.doc_count())
+
+        # The term vectors are fetched in batches, and the documents whose
+        # term vector could not be fetched (no terms) are skipped
         scores = map(
-            lambda doc: (
-                cosine_similarity(self.tfw_orig, toTFIDF(_client, self.index, doc)),
-                doc,
-            ),
-            doc_ids,
+            lambda hit: (cosine_similarity(self.tfw_orig, tfidf(hit[1])), hit[0][0]),
+            filter(lambda hit: hit[1], _backend.stream_term_freqs(hits, _stats)),
         )
 
         return nlargest(self.n, scores)
 
 
-def main(index: str, path: str, n: int, ignore_paths: List[str], slices: int):
-    client = Elasticsearch(timeout=1000)
+def main_store(
+    index: str,
+    path: str,
+    n: int,
+    ignore_paths: List[str],
+    backend: str,
+    store: str,
+):
+    # Search with the inverted index of the vector store, the ignored paths
+    # are never scored
+    vectors = open_store(store, backend, index)
+
+    row = vectors.doc_row(path)
+    tfw_orig = vectors.term_weights(row)
+
+    print("Original file:", vectors.doc_id(row), path, sep="\t", file=sys.stderr)
+    keywords = [x[0] for x in nlargest(10, tfw_orig, key=lambda x: x[1])]
+    print("Keywords:", ", ".join(keywords))
+
+    ignore = [vectors.prefix_rows(p) for p in ignore_paths]
+    for score, result in vectors.top_k(vectors.vector(row), n, ignore):
+        print(score, vectors.doc_id(result), end="\t", sep="\t")
+        print(vectors.doc_path(result))
+
+
+def main(
+    index: str,
+    path: str,
+    n: int,
+    ignore_paths: List[str],
+    slices: int,
+    backend: str = "elasticsearch",
+    store: str | None = None,
+):
+    if store:
+        return main_store(index, path, n, ignore_paths, backend, store)
+
+    client = open_backend(backend, index)
+    stats = CollectionStats(client)
 
     print(ignore_paths)
 
-    doc_original = search_file_by_path(client, index, path)
+    doc_original = search_file_by_path(client, path)
 
-    tfidf = partial(toTFIDF, client, index)
+    tfidf = partial(toTFIDF, client, stats=stats)
 
     tfw_orig = list(tfidf(doc_original))
 
@@ -77,7 +113,7 @@ def main(index: str, path: str, n: int, ignore_paths: List[str], slices: int):
 
     slicer = Slicer(index, n, tfw_orig, slices, ignore_paths)
 
-    with Pool(slices, initializer=worker_init) as p:
+    with Pool(slices, initializer=worker_init, initargs=(backend, index, stats)) as p:
         results = p.map(slicer.process_slice, range(slices))
 
     results = nlargest(n, chain(*results), key=lambda x: x[0])
@@ -85,13 +121,18 @@ def main(index: str, path: str, n: int, ignore_paths: List[str], slices: int):
     for score, docid in results:
         print(score, docid, end="\t", sep="\t")
         # get the document
-        doc = client.get(index=index, id=docid)
-        print(doc["_source"]["path"])
+        print(client.doc_path(docid))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Search for a file using its path")
     parser.add_argument("--index", type=str, help="index to search in")
+    parser.add_argument(
+        "--backend",
+        default="elasticsearch",
+        choices=BACKENDS,
+        help="Where the term vectors are read from",
+    )
     parser.add_argument("path", type=str, help="path of the file to search")
     parser.add_argument(
         "--ignore-paths",
@@ -107,6 +148,12 @@ if __name__ == "__main__":
         default=cpu_count() - 1,
     )
     parser.add_argument("-n", type=int, default=10, help="number of results to return")
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="search the vector store in this directory, built if it is not up to date",
+    )
     args = parser.parse_args()
 
     try:
@@ -116,7 +163,9 @@ if __name__ == "__main__":
             args.n,
             ignore_paths=args.ignore_paths,
             slices=args.nproc,
+            backend=args.backend,
+            store=args.store,
         )
-    except NotFoundError:
+    except INDEX_NOT_FOUND:
         print("Not found", file=sys.stderr)
         sys.exit(1)
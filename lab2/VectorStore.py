@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: VectorStore
+
+VectorStore
+******
+
+:Description: VectorStore
+
+    Stores the normalized TF-IDF vectors of all the documents of an index
+    (--index, read with --backend) in the directory passed as a parameter
+    (--store), so that a vector is read without fetching its term vector
+    and the cosine similarity is a sparse dot product
+
+    Every term of the index has a stable integer id, its line in the sorted
+    term dictionary, and the vectors are the rows of a CSR matrix sorted by
+    path, with the weights of TFIDFViewer.toTFIDF. The document frequencies
+    are counted from the term vectors of the documents.
+
+    The store directory holds:
+
+    meta.json: number of documents and terms, and generation of the index
+    paths.txt: path of each document, sorted (the row is the line)
+    ids.txt: id of the document of each row in the index
+    terms.txt: the term dictionary, sorted (the term id is the line)
+    indptr.npy, indices.npy, data.npy: term ids and weights of each row
+    postings_indptr.npy, postings_rows.npy, postings_data.npy: the inverted
+        index, rows and weights of each term (the CSC layout of the matrix)
+    max_weights.npy: largest weight of each term
+
+    The store is built again when the generation of the index changes
+
+    top_k finds the documents most similar to a vector with max-score
+    pruning: terms are added from the one that can contribute most, and once
+    the remaining terms can not lift an unseen document into the top k only
+    the current candidates are scored
+
+:Version:
+
+:Date:  18/10/2026
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from bisect import bisect_left
+from itertools import chain
+from multiprocessing import Pool, cpu_count
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from backends import BACKENDS, open_backend
+from scipy import sparse
+
+STORE_VERSION = 2  # layout of the store, older stores are built again
+
+Vector = Tuple[np.ndarray, np.ndarray]  # term ids and weights of a document
+
+
+def worker_init(backend: str, index: str):
+    global _backend
+    _backend = open_backend(backend, index)
+
+
+def read_slice(slices: int, slice_no: int) -> List[Tuple[str, str, List]]:
+    """
+    Returns the id, path and term frequencies of the documents of a slice
+
+    :param slices:
+    :param slice_no:
+    :return:
+    """
+    hits = _backend.scan(slice_no, slices)
+    return [
+        (id, path, term_freqs)
+        for (id, path), term_freqs in _backend.stream_term_freqs(hits)
+    ]
+
+
+def build_store(
+    store: str, backend: str, index: str, nprocs: int = max(cpu_count() - 2, 1)
+) -> int:
+    """
+    Builds the vector store of an index in the directory store, replacing it
+    atomically if it exists
+
+    :param store:
+    :param backend:
+    :param index:
+    :param nprocs: processes reading the term vectors
+    :return: the number of stored documents
+    """
+    generation = open_backend(backend, index).generation()
+
+    with Pool(nprocs, initializer=worker_init, initargs=(backend, index)) as pool:
+        docs = list(
+            chain(*pool.starmap(read_slice, [(nprocs, i) for i in range(nprocs)]))
+        )
+    docs.sort(key=lambda doc: doc[1])
+
+    terms = sorted(set(t for _, _, term_freqs in docs for t, _ in term_freqs))
+    term_ids = {t: i for i, t in enumerate(terms)}
+
+    indptr = np.zeros(len(docs) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(term_freqs) for _, _, term_freqs in docs])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    freqs = np.empty(indptr[-1], dtype=np.float64)
+    for d, (_, _, term_freqs) in enumerate(docs):
+        indices[indptr[d] : indptr[d + 1]] = [term_ids[t] for t, _ in term_freqs]
+        freqs[indptr[d] : indptr[d + 1]] = [f for _, f in term_freqs]
+
+    # Weights of TFIDFViewer.toTFIDF: tf / max tf * log(N / df), normalized
+    df = np.bincount(indices, minlength=len(terms))
+    idf = np.log(len(docs) / np.maximum(df, 1))
+    rows = np.repeat(np.arange(len(docs)), np.diff(indptr))
+    starts = indptr[:-1][np.diff(indptr) > 0]  # reduceat skips empty rows
+    max_freq = np.ones(len(docs))
+    max_freq[rows[starts]] = np.maximum.reduceat(freqs, starts)
+    weights = freqs / max_freq[rows] * idf[indices]
+    norms = np.ones(len(docs))
+    norms[rows[starts]] = np.sqrt(np.add.reduceat(weights**2, starts))
+    data = (weights / np.where(norms, norms, 1)[rows]).astype(np.float32)
+
+    tmp = f"{store.rstrip('/')}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for name, lines in [
+        ("paths", [path for _, path, _ in docs]),
+        ("ids", [str(id) for id, _, _ in docs]),
+        ("terms", terms),
+    ]:
+        with open(os.path.join(tmp, f"{name}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+    postings = sparse.csr_matrix(
+        (data, indices, indptr), shape=(len(docs), len(terms))
+    ).tocsc()
+    postings.sort_indices()
+    max_weights = np.zeros(len(terms), dtype=np.float32)
+    if len(data):
+        np.maximum.at(max_weights, indices, data)
+
+    for name, a in [
+        ("indptr", indptr),
+        ("indices", indices),
+        ("data", data),
+        ("postings_indptr", postings.indptr.astype(np.int64)),
+        ("postings_rows", postings.indices.astype(np.int32)),
+        ("postings_data", postings.data.astype(np.float32)),
+        ("max_weights", max_weights),
+    ]:
+        np.save(os.path.join(tmp, f"{name}.npy"), a)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "version": STORE_VERSION,
+                "documents": len(docs),
+                "terms": len(terms),
+                "backend": backend,
+                "index": index,
+                "generation": generation,
+            },
+            f,
+        )
+
+    if os.path.exists(store):
+        shutil.rmtree(store)
+    os.replace(tmp, store)
+
+    return len(docs)
+
+
+def read_meta(store: str) -> Dict:
+    with open(os.path.join(store, "meta.json")) as f:
+        return json.load(f)
+
+
+def sparse_cosine(v1: Vector, v2: Vector) -> float:
+    """
+    Computes the cosine similarity between two normalized vectors
+
+    :param v1:
+    :param v2:
+    :return:
+    """
+    _, i1, i2 = np.intersect1d(v1[0], v2[0], assume_unique=True, return_indices=True)
+    return float(np.dot(v1[1][i1].astype(np.float64), v2[1][i2]))
+
+
+class VectorStore:
+    """
+    Store built by build_store. The arrays are memory-mapped, so reading a
+    vector only slices them.
+    """
+
+    def __init__(self, store: str):
+        self.store = store
+        self.meta = read_meta(store)
+
+        def lines(name, count):
+            with open(os.path.join(store, f"{name}.txt"), encoding="utf-8") as f:
+                return f.read().split("\n") if count else []
+
+        self.paths = lines("paths", self.meta["documents"])
+        self.ids = lines("ids", self.meta["documents"])
+        self.terms = lines("terms", self.meta["terms"])
+
+        def load(name):
+            return np.load(os.path.join(store, f"{name}.npy"), mmap_mode="r")
+
+        self.indptr = load("indptr")
+        self.indices = load("indices")
+        self.data = load("data")
+        self.postings_indptr = load("postings_indptr")
+        self.postings_rows = load("postings_rows")
+        self.postings_data = load("postings_data")
+        self.max_weights = load("max_weights")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def doc_row(self, path: str) -> int:
+        i = bisect_left(self.paths, path)
+        if i == len(self.paths) or self.paths[i] != path:
+            raise NameError(f"File [{path}] not found")
+        return i
+
+    def prefix_rows(self, prefix: str) -> Tuple[int, int]:
+        """
+        Returns the range of rows whose path starts with prefix, they are
+        contiguous because the paths are sorted
+
+        :param prefix:
+        :return:
+        """
+        if not prefix:
+            return 0, len(self.paths)
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return bisect_left(self.paths, prefix), bisect_left(self.paths, end)
+
+    def doc_path(self, row: int) -> str:
+        return self.paths[row]
+
+    def doc_id(self, row: int) -> str:
+        return self.ids[row]
+
+    def vector(self, row: int) -> Vector:
+        a, b = self.indptr[row], self.indptr[row + 1]
+        return self.indices[a:b], self.data[a:b]
+
+    def term_weights(self, row: int) -> List[Tuple[str, float]]:
+        """
+        Returns the vector of a document as sorted (term, weight) pairs, as
+        TFIDFViewer.toTFIDF
+
+        :param row:
+        :return:
+        """
+        indices, data = self.vector(row)
+        return [(self.terms[t], w) for t, w in zip(indices, data.tolist())]
+
+    def cosine(self, row1: int, row2: int) -> float:
+        return sparse_cosine(self.vector(row1), self.vector(row2))
+
+    def postings(self, term: int) -> Vector:
+        a, b = self.postings_indptr[term], self.postings_indptr[term + 1]
+        return self.postings_rows[a:b], self.postings_data[a:b]
+
+    def top_k(
+        self, vector: Vector, k: int, ignore: Iterable[Tuple[int, int]] = ()
+    ) -> List[Tuple[float, int]]:
+        """
+        Returns the k rows most similar to a vector with their cosine
+        similarity, from the most similar one
+
+        :param vector: term ids and weights of a normalized vector
+        :param k:
+        :param ignore: ranges of rows that are not scored (see prefix_rows)
+        :return:
+        """
+        allowed = np.ones(len(self.paths), dtype=bool)
+        for lo, hi in ignore:
+            allowed[lo:hi] = False
+
+        terms, weights = vector
+        weights = np.asarray(weights, dtype=np.float64)
+        bounds = weights * self.max_weights[terms]
+        order = [i for i in np.argsort(-bounds, kind="stable") if bounds[i] > 0]
+        remaining = float(np.sum(bounds[order]))
+
+        def kth(candidates):
+            if len(candidates) < k:
+                return 0.0
+            return np.partition(scores[candidates], -k)[-k]
+
+        scores = np.zeros(len(self.paths))
+        candidates = np.empty(0, dtype=np.int64)
+        threshold = 0.0
+
+        # Every posting of the terms that can still lift an unseen row into
+        # the top k is a candidate
+        i = 0
+        while i < len(order) and remaining >= threshold:
+            t = order[i]
+            rows, data = self.postings(terms[t])
+            keep = allowed[rows]
+            rows = rows[keep]
+            scores[rows] += weights[t] * data[keep]
+            candidates = np.union1d(candidates, rows)
+            remaining -= bounds[t]
+            threshold = kth(candidates)
+            i += 1
+
+        # Only the candidates that can still reach the threshold are scored
+        # with the rest of the terms
+        for t in order[i:]:
+            candidates = candidates[scores[candidates] + remaining >= threshold]
+            rows, data = self.postings(terms[t])
+            pos = np.searchsorted(rows, candidates)
+            found = pos < len(rows)
+            found[found] = rows[pos[found]] == candidates[found]
+            scores[candidates[found]] += weights[t] * data[pos[found]]
+            remaining -= bounds[t]
+            threshold = kth(candidates)
+
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        return [(float(scores[row]), int(row)) for row in top]
+
+    def matrix(self) -> sparse.csr_matrix:
+        """
+        Returns the vectors as a documents x terms CSR matrix over the mapped
+        arrays
+
+        :return:
+        """
+        return sparse.csr_matrix(
+            (self.data, self.indices, self.indptr),
+            shape=(len(self.paths), len(self.terms)),
+            copy=False,
+        )
+
+    def postings_matrix(self) -> sparse.csr_matrix:
+        """
+        Returns the transposed vectors, a terms x documents CSR matrix over the
+        mapped arrays of the inverted index
+
+        :return:
+        """
+        return sparse.csr_matrix(
+            (self.postings_data, self.postings_rows, self.postings_indptr),
+            shape=(len(self.terms), len(self.paths)),
+            copy=False,
+        )
+
+
+def open_store(
+    store: str,
+    backend: str,
+    index: str,
+    rebuild: bool = False,
+    nprocs: int = max(cpu_count() - 2, 1),
+) -> VectorStore:
+    """
+    Opens the vector store of an index, building it first if it does not
+    exist or the index has changed since it was built
+
+    :param store:
+    :param backend:
+    :param index:
+    :param rebuild: build the store even if it is up to date
+    :param nprocs:
+    :return:
+    """
+    if not rebuild:
+        try:
+            meta = read_meta(store)
+            generation = open_backend(backend, index).generation()
+            # The generation is compared as it is stored in meta.json
+            rebuild = (
+                meta.get("version"),
+                meta["backend"],
+                meta["index"],
+                meta["generation"],
+            ) != (STORE_VERSION, backend, index, json.loads(json.dumps(generation)))
+        except FileNotFoundError:
+            rebuild = True
+
+    if rebuild:
+        print(f"Building the vector store {store} ...", file=sys.stderr)
+        build_store(store, backend, index, nprocs)
+
+    return VectorStore(store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--index",
+        default=None,
+        required=True,
+        help="Index to store (directory of the index with --backend local)",
+    )
+    parser.add_argument(
+        "--backend",
+        default="elasticsearch",
+        choices=BACKENDS,
+        help="Where the term vectors are read from",
+    )
+    parser.add_argument(
+        "--store", default=None, required=True, help="Directory of the vector store"
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Build the store even if it is up to date",
+    )
+    parser.add_argument(
+        "--nprocs",
+        type=int,
+        default=max(cpu_count() - 2, 1),
+        help="Number of processes reading the term vectors",
+    )
+
+    args = parser.parse_args()
+
+    vectors = open_store(
+        args.store, args.backend, args.index, args.rebuild, args.nprocs
+    )
+    print("Stored:", len(vectors), "documents,", len(vectors.terms), "terms")
@@ -0,0 +1,359 @@
+"""
+.. module:: backends
+
+backends
+******
+
+:Description: backends
+
+    Document stores the TF-IDF scripts can read the term vectors from:
+
+    elasticsearch: an index built by IndexFilesPreprocess_par.py
+    local: an on-disk index built by LocalIndex.py, read at memory speed
+
+    Both backends have the same methods:
+
+    doc_id(path): id of the document with that path (NameError if none)
+    doc_ids(paths): ids of the documents with those paths (None if none),
+        resolved in bulk
+    doc_path(id): path of a document
+    doc_count(): number of documents
+    doc_freqs(terms): number of documents that contain each term
+    generation(): value that changes whenever the index changes
+    term_freqs(id): sorted (term, frequency) pairs of a document
+    term_vector(id): sorted (term, frequency) and (term, document frequency)
+        pairs of a document
+    scan(slice_no, slices): (id, path) of the documents of a slice
+    stream_term_freqs(hits, stats): each (id, path) hit with the term_freqs
+        of its document, fetched in batches (see termvectors). The document
+        frequencies of the terms are added to the CollectionStats stats.
+
+    CollectionStats caches the number of documents and the document
+    frequencies of an index until its generation changes
+
+:Version:
+
+:Date:  18/10/2026
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from LocalIndex import LocalIndex
+
+try:
+    from elasticsearch import Elasticsearch
+    from elasticsearch.client import CatClient
+    from elasticsearch.exceptions import NotFoundError, TransportError
+    from elasticsearch_dsl import Search
+    from elasticsearch_dsl.query import Q
+
+    # The shared modules of the labs are in common/, next to the lab directories
+    sys.path.append(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
+    )
+    from termvectors import stream_term_vectors
+except ImportError:  # only the local backend can be used
+    Elasticsearch = None
+
+    class NotFoundError(Exception):
+        pass
+
+    class TransportError(Exception):
+        pass
+
+
+BACKENDS = ["elasticsearch", "local"]
+
+# Errors raised when the index does not exist
+INDEX_NOT_FOUND = (NotFoundError, FileNotFoundError)
+
+MSEARCH_BATCH = 500  # terms counted by each msearch request
+
+STATS_MAX_AGE = 60.0  # seconds between checks of the generation of an index
+
+
+class ElasticBackend:
+    def __init__(self, index: str, client: Elasticsearch | None = None):
+        if Elasticsearch is None:
+            raise ImportError(
+                "The elasticsearch backend needs elasticsearch and elasticsearch_dsl"
+            )
+        self.index = index
+        self.client = client if client else Elasticsearch(timeout=1000)
+
+    def doc_id(self, path: str) -> str:
+        """
+        Search for a file using its path
+
+        :param path:
+        :return:
+        """
+        s = Search(using=self.client, index=self.index)
+        q = Q("match", path=path)  # exact search in the path field
+        s = s.query(q)
+        result = s.scan()
+
+        try:
+            first = next(result)
+        except StopIteration:
+            raise NameError(f"File [{path}] not found")
+
+        return first.meta.id
+
+    def doc_ids(self, paths: List[str]) -> List[str | None]:
+        """
+        Searches for many files with the query of doc_id, sending
+        MSEARCH_BATCH queries per request
+
+        :param paths:
+        :return:
+        """
+        ids = []
+        for i in range(0, len(paths), MSEARCH_BATCH):
+            body = []
+            for path in paths[i : i + MSEARCH_BATCH]:
+                body.append({})
+                body.append(
+                    {"size": 1, "_source": False, "query": {"match": {"path": path}}}
+                )
+            responses = self.client.msearch(index=self.index, body=body)["responses"]
+            for r in responses:
+                hits = r["hits"]["hits"]
+                ids.append(hits[0]["_id"] if hits else None)
+        return ids
+
+    def doc_path(self, id: str) -> str:
+        return self.client.get(index=self.index, id=id)["_source"]["path"]
+
+    def doc_count(self) -> int:
+        return int(
+            CatClient(self.client).count(index=[self.index], format="json")[0]["count"]
+        )
+
+    def doc_freqs(self, terms: List[str]) -> List[int]:
+        """
+        Returns the number of documents that contain each term, counting
+        MSEARCH_BATCH terms per request. Only live documents are counted,
+        unlike the doc_freq of the term vectors, which counts deleted
+        documents until their segments are merged, so CollectionStats only
+        uses it for the terms it has not seen in a term vector
+
+        :param terms:
+        :return:
+        """
+        freqs = []
+        for i in range(0, len(terms), MSEARCH_BATCH):
+            body = []
+            for t in terms[i : i + MSEARCH_BATCH]:
+                body.append({})
+                body.append(
+                    {
+                        "size": 0,
+                        "track_total_hits": True,
+                        "query": {"term": {"text": t}},
+                    }
+                )
+            responses = self.client.msearch(index=self.index, body=body)["responses"]
+            freqs.extend(r["hits"]["total"]["value"] for r in responses)
+        return freqs
+
+    def generation(self) -> Tuple[str, int, int]:
+        """
+        Returns the uuid and the number of live and deleted documents of the
+        index, which change when it is created again or a document is
+        indexed, updated or deleted
+
+        :return:
+        """
+        stats = self.client.indices.stats(index=self.index, metric="docs")
+        index = next(iter(stats["indices"].values()))
+        docs = index["primaries"]["docs"]
+        return index["uuid"], docs["count"], docs["deleted"]
+
+    def term_freqs(self, id: str) -> List[Tuple[str, int]]:
+        termvector = self.client.termvectors(index=self.index, id=id, fields=["text"])
+
+        if "text" not in termvector["term_vectors"]:
+            return []
+        terms = termvector["term_vectors"]["text"]["terms"]
+        return sorted((t, data["term_freq"]) for t, data in terms.items())
+
+    def term_vector(
+        self, id: str
+    ) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        termvector = self.client.termvectors(
+            index=self.index,
+            id=id,
+            fields=["text"],
+            positions=False,
+            term_statistics=True,
+        )
+
+        file_td = {}
+        file_df = {}
+
+        if "text" in termvector["term_vectors"]:
+            for t, data in termvector["term_vectors"]["text"]["terms"].items():
+                file_td[t] = data["term_freq"]
+                file_df[t] = data["doc_freq"]
+        return sorted(file_td.items()), sorted(file_df.items())
+
+    def stream_term_freqs(
+        self, hits: Iterable[Tuple[str, str]], stats: CollectionStats | None = None
+    ) -> Iterator[Tuple[Tuple[str, str], List[Tuple[str, int]]]]:
+        """
+        Yields each hit with the sorted (term, frequency) pairs of its
+        document, fetched with multi-termvectors requests
+
+        :param hits: (id, path) pairs, as yielded by scan
+        :param stats: CollectionStats where the document frequencies of the
+            terms, fetched with the term vectors, are added before each hit
+            is yielded
+        :return:
+        """
+        for hit, terms in stream_term_vectors(
+            self.client,
+            self.index,
+            hits,
+            key=lambda hit: hit[0],
+            term_statistics=stats is not None,
+        ):
+            if stats is not None:
+                stats.add_doc_freqs((t, data["doc_freq"]) for t, data in terms.items())
+            yield hit, sorted((t, data["term_freq"]) for t, data in terms.items())
+
+    def scan(self, slice_no: int = 0, slices: int = 1) -> Iterator[Tuple[str, str]]:
+        s = Search(using=self.client, index=self.index).query("match_all")
+        if slices > 1:
+            s = s.extra(slice={"id": slice_no, "max": slices})
+        for hit in s.scan():
+            yield hit.meta.id, hit.path
+
+
+class CollectionStats:
+    """
+    Number of documents and document frequencies of the terms of an index,
+    fetched from the backend once per generation of the index.
+
+    The document frequencies are usually added from the term vectors of
+    the documents (see add_doc_freqs), the backend is only asked for the
+    terms that have not been seen yet.
+
+    The generation is checked at most every max_age seconds, and right away
+    when a document has terms that are not cached while the statistics are
+    warm (see has_doc_freqs). So when the index changes, the cached document
+    frequencies of the terms already seen may be served stale for up to
+    max_age seconds, the tradeoff for not checking it on every document.
+
+    The statistics can be passed to worker processes, which bind them to
+    their own backend.
+    """
+
+    def __init__(self, backend, max_age: float = STATS_MAX_AGE):
+        self.backend = backend
+        self.max_age = max_age
+        self.generation = None
+        self.checked = float("-inf")
+        self.count: int | None = None
+        self.df: Dict[str, int] = {}
+        self.warm = False
+
+    def __getstate__(self):
+        # Clients can not be pickled, each worker binds its own backend
+        state = self.__dict__.copy()
+        state["backend"] = None
+        return state
+
+    def bind(self, backend) -> CollectionStats:
+        self.backend = backend
+        return self
+
+    def check(self, force: bool = False):
+        """
+        Forgets the statistics if the index has changed since they were fetched
+
+        :param force: check the generation even if it was checked less than
+            max_age seconds ago
+        """
+        now = time.monotonic()
+        if not force and now - self.checked < self.max_age:
+            return
+        generation = self.backend.generation()
+        self.checked = now
+        if generation != self.generation:
+            self.generation = generation
+            self.count = None
+            self.df = {}
+            self.warm = False
+
+    def doc_count(self) -> int:
+        """
+        Returns the number of documents in the index
+
+        :return:
+        """
+        self.check()
+        if self.count is None:
+            self.count = self.backend.doc_count()
+        return self.count
+
+    def add_doc_freqs(self, doc_freqs: Iterable[Tuple[str, int]]):
+        """
+        Caches the document frequencies of some terms, as read with the term
+        vectors of a document
+
+        :param doc_freqs: (term, document frequency) pairs
+        :return:
+        """
+        self.check()
+        self.df.update(doc_freqs)
+
+    def has_doc_freqs(self, terms: List[str]) -> bool:
+        """
+        Returns whether the document frequencies of all the terms are cached.
+        The statistics stay warm while they are. A term that is not cached
+        while they are warm may come from a change of the index, so its
+        generation is checked.
+
+        :param terms:
+        :return:
+        """
+        self.check()
+        warm, self.warm = self.warm, all(t in self.df for t in terms)
+        if warm and not self.warm:
+            self.check(force=True)
+        return self.warm
+
+    def doc_freqs(self, terms: List[str]) -> List[int]:
+        """
+        Returns the number of documents that contain each term, fetching only
+        the terms that are not cached
+
+        :param terms:
+        :return:
+        """
+        self.check()
+        missing = [t for t in terms if t not in self.df]
+        if missing:
+            self.df.update(zip(missing, self.backend.doc_freqs(missing)))
+        return [self.df[t] for t in terms]
+
+
+def open_backend(backend: str, index: str):
+    """
+    Opens an index with a backend
+
+    :param backend: one of BACKENDS
+    :param index: name of the Elasticsearch index or directory of the local index
+    :return:
+    """
+    if backend == "elasticsearch":
+        return ElasticBackend(index)
+    if backend == "local":
+        return LocalIndex(index)
+    raise ValueError(f"Unknown backend: {backend}")
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pytest
+from AllPairs import Neighbors, all_pairs
+from LocalIndex import Analyzer, build_index
+from VectorStore import open_store
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    # A local index of random documents over a small vocabulary, so that most
+    # pairs of documents share some terms
+    tmp = tmp_path_factory.mktemp("collection")
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(300)]
+    probs = 1 / np.arange(1, len(words) + 1)
+    files = []
+    for d in range(200):
+        path = os.path.join(tmp, f"doc{d:03d}.txt")
+        with open(path, "w", encoding="iso-8859-1") as f:
+            f.write(" ".join(rng.choice(words, 50, p=probs / probs.sum())))
+        files.append(path)
+
+    index, store = str(tmp / "index"), str(tmp / "store")
+    build_index(index, files, Analyzer(), nprocs=2)
+    return store, open_store(store, "local", index, nprocs=2)
+
+
+def brute_force(X, row):
+    scores = X @ X[row]
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    return scores, order
+
+
+@pytest.mark.parametrize("k", [1, 10, 200])
+def test_top_k_matches_brute_force(store, k):
+    _, vectors = store
+    X = vectors.matrix().toarray().astype(np.float64)
+    for row in range(0, len(vectors), 17):
+        scores, order = brute_force(X, row)
+        top = vectors.top_k(vectors.vector(row), k)
+        expected = scores[order[:k]]
+        expected = expected[expected > 0]
+        assert np.allclose([s for s, _ in top], expected, rtol=0, atol=1e-6)
+        assert np.allclose([scores[r] for _, r in top], expected, rtol=0, atol=1e-6)
+
+
+def test_top_k_ignores_rows(store):
+    _, vectors = store
+    top = vectors.top_k(vectors.vector(0), 10, ignore=[(0, 50)])
+    assert all(row >= 50 for _, row in top)
+
+
+@pytest.mark.parametrize("k, threshold", [(5, None), (0, 0.2), (3, 0.3)])
+def test_all_pairs_matches_brute_force(store, tmp_path, k, threshold):
+    path, vectors = store
+    X = vectors.matrix().toarray().astype(np.float64)
+    output = str(tmp_path / "neighbors.npy")
+
+    # A budget of a few rows per block, to go through several of them
+    total = all_pairs(path, output, k, threshold, budget=40 * 12 * 200, nprocs=2)
+    neighbors = Neighbors(output)
+    assert len(neighbors.records) == total
+
+    for row in range(len(vectors)):
+        scores, order = brute_force(X, row)
+        scores[row] = 0
+        order = order[order != row]
+        keep = np.zeros(len(scores), dtype=bool)
+        keep[order[:k]] = True
+        if threshold is not None:
+            keep |= scores >= threshold
+        keep &= scores > 0
+
+        found = neighbors.neighbors(row)
+        expected = np.sort(scores[keep])[::-1]
+        assert np.allclose([s for _, s in found], expected, rtol=0, atol=1e-6)
+        assert np.allclose([scores[r] for r, _ in found], expected, rtol=0, atol=1e-6)
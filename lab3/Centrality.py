@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Other centralities of the airports, to compare with PageRank.py
+#
+# HITS hubs and authorities, Katz and eigenvector centrality, computed on
+# the same graph arrays (and graph cache) as PageRank with sparse products
+# and the same stopping criterion. All the scores are normalized to sum 1,
+# so they are printed in the same format as the PageRanks.
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import Tuple
+
+import numpy as np
+from PageRank import GRAPH_CACHE, outputPageRanks, powerIteration, readGraph
+from scipy import sparse
+from scipy.sparse.linalg import ArpackError, eigs
+
+MEASURES = ["hits", "katz", "eigenvector"]
+
+KATZ_ATTENUATION = 0.9  # fraction of the largest attenuation that converges
+
+
+def spectralRadius(A: sparse.csr_matrix) -> float:
+    # Spectral radius of A: as A is not negative, its Perron root, the
+    # eigenvalue with the largest real part. Falls back to an upper bound,
+    # the largest row or column sum, whichever is smaller, if ARPACK fails
+    A = A.astype(np.float64)
+    n = A.shape[0]
+    if A.nnz == 0:
+        radius = 0
+    elif n < 3:  # too small for ARPACK
+        radius = np.max(np.abs(np.linalg.eigvals(A.toarray())), initial=0)
+    else:
+        try:
+            values = eigs(A, k=1, which="LR", v0=np.ones(n), return_eigenvectors=False)
+            radius = values[0].real
+        except ArpackError:
+            print("The spectral radius did not converge, bounding it", file=sys.stderr)
+            rows = np.max(np.asarray(A.sum(axis=1)), initial=0)
+            columns = np.max(np.asarray(A.sum(axis=0)), initial=0)
+            radius = min(rows, columns)
+    return float(radius) or 1.0
+
+
+def computeHITS(
+    A: sparse.csr_matrix, maxIterations=1000, atol=1e-10
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    # compute the hub and authority scores of the airports
+    #
+    # A: the adjacency matrix of the graph (see Graph.adjacencyMatrix)
+    # The authorities are the fixed point of a = A @ A.T @ a (airports
+    # reached from good hubs) and the hubs are h = A.T @ a. Returns the
+    # hubs, the authorities and the iterations.
+    n = A.shape[0]
+    AT = A.T.tocsr()
+
+    def step(a):
+        a = A @ (AT @ a)
+        return a / np.sum(a)
+
+    a, iterations = powerIteration(step, np.ones(n) / n, maxIterations, atol)
+    h = AT @ a
+    return h / np.sum(h), a, iterations
+
+
+def computeKatzCentrality(
+    A: sparse.csr_matrix,
+    attenuation=KATZ_ATTENUATION,
+    maxIterations=1000,
+    atol=1e-10,
+) -> Tuple[np.ndarray, int]:
+    # compute the Katz centrality of the airports
+    #
+    # A: the adjacency matrix of the graph (see Graph.adjacencyMatrix)
+    # attenuation: weight of each extra hop, as a fraction of the largest
+    #   one for which the series converges
+    #
+    # Fixed point of x = alpha * A @ x + 1 / n, with alpha = attenuation / the
+    # spectral radius of A, so the error shrinks by about attenuation per
+    # iteration.
+    n = A.shape[0]
+    alpha = attenuation / spectralRadius(A)
+    beta = np.full(n, 1 / n)
+
+    def step(x):
+        return alpha * (A @ x) + beta
+
+    x, iterations = powerIteration(step, beta, maxIterations, atol)
+    return x / np.sum(x), iterations
+
+
+def computeEigenvectorCentrality(
+    A: sparse.csr_matrix, maxIterations=1000, atol=1e-10
+) -> Tuple[np.ndarray, int]:
+    # compute the eigenvector centrality of the airports
+    #
+    # A: the adjacency matrix of the graph (see Graph.adjacencyMatrix)
+    # Iterates with A + I, which has the same dominant eigenvector as A
+    # but does not oscillate on periodic graphs.
+    n = A.shape[0]
+
+    def step(x):
+        x = x + A @ x
+        return x / np.sum(x)
+
+    return powerIteration(step, np.ones(n) / n, maxIterations, atol)
+
+
+def main(
+    airports="airports.txt",
+    routes="routes.txt",
+    measure="hits",
+    attenuation: float = KATZ_ATTENUATION,
+    maxIterations: int = 1000,
+    atol: float = 1e-10,
+    top_n: int = 10,
+    all: bool = False,
+    cache: str | None = GRAPH_CACHE,
+    rebuildCache: bool = False,
+):
+    graph = readGraph(airports, routes, cache, rebuildCache)
+
+    if all:
+        top_n = len(graph)
+
+    time1 = time.time()
+    A = graph.adjacencyMatrix()
+    if measure == "hits":
+        h, a, iterations = computeHITS(A, maxIterations, atol)
+        scores = [("hub score", h), ("authority score", a)]
+    elif measure == "katz":
+        x, iterations = computeKatzCentrality(A, attenuation, maxIterations, atol)
+        scores = [("Katz centrality", x)]
+    elif measure == "eigenvector":
+        x, iterations = computeEigenvectorCentrality(A, maxIterations, atol)
+        scores = [("eigenvector centrality", x)]
+    else:
+        raise ValueError(f"Unknown measure: {measure}")
+    time2 = time.time()
+
+    if iterations == maxIterations - 1:
+        print(f"Did not converge after {maxIterations} iterations", file=sys.stderr)
+    else:
+        print("#Iterations:", iterations, file=sys.stderr)
+
+    for label, x in scores:
+        outputPageRanks(graph, x, top_n, label)
+    print(f"Time of {measure}:", time2 - time1, file=sys.stderr)
+
+    return scores, iterations, time2 - time1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--airports",
+        default="airports.txt",
+        help="The file containing the airports data",
+    )
+    parser.add_argument(
+        "--routes",
+        default="routes.txt",
+    )
+    parser.add_argument(
+        "--cache",
+        default=GRAPH_CACHE,
+        help="Directory where the parsed graph is cached between runs",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_const",
+        const=None,
+        help="Always parse the input files",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Parse the input files even if the cache is up to date",
+    )
+    parser.add_argument(
+        "--measure",
+        choices=MEASURES,
+        default="hits",
+        help="The centrality to compute",
+    )
+    parser.add_argument(
+        "--attenuation",
+        type=float,
+        default=KATZ_ATTENUATION,
+        help="Katz attenuation, as a fraction of the largest one that converges",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-10,
+        help="The tolerance for the stopping criterion",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=1000,
+        help="The maximum number of iterations",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--top", type=int, default=10, help="The number of top airports to print"
+    )
+    group.add_argument(
+        "--all", action="store_true", help="Print all airports, not just the top ones"
+    )
+
+    args = parser.parse_args()
+    main(
+        args.airports,
+        args.routes,
+        args.measure,
+        args.attenuation,
+        args.max_iterations,
+        args.tolerance,
+        args.top,
+        args.all,
+        args.cache,
+        args.rebuild_cache,
+    )
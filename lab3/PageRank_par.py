@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+# Parallel implementation of PageRank.py
+#
+# The airports are split in contiguous blocks of destinations with about
+# the same number of incoming routes. Each worker owns one block and
+# computes its slice of q on every iteration; the normalization and the
+# convergence check are reduced through small per-worker arrays between
+# barriers, so workers never wait on a coordinator.
+
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from multiprocessing import Barrier, Process, cpu_count
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PageRank import GRAPH_CACHE, danglingNodes, outputPageRanks, readGraph
+from scipy import sparse
+
+BACKENDS = ["thread", "process"]
+
+
+def blockBounds(M: sparse.csr_matrix, workers: int) -> np.ndarray:
+    # Split the rows of M in contiguous blocks with similar number of edges
+    n = M.shape[0]
+    targets = np.linspace(0, M.nnz, workers + 1)
+    bounds = np.searchsorted(M.indptr, targets)
+    bounds[0], bounds[-1] = 0, n
+    return np.maximum.accumulate(bounds)
+
+
+def iterateBlock(
+    w: int,
+    rows: slice,
+    M_rows: sparse.csr_matrix,
+    P: np.ndarray,
+    v: np.ndarray,
+    sinks: np.ndarray,
+    partials: np.ndarray,
+    barrier,
+    l: float,
+    maxIterations: int,
+    atol: float,
+    dangling: str,
+) -> Tuple[int, int]:
+    # Power iteration of worker w over its block of rows
+    #
+    # P holds the two rank vectors, which swap roles every iteration.
+    # partials holds, per worker, the sum of its slice of q, whether it has
+    # converged and the rank of its sinks. Returns the iteration count and
+    # which row of P has the result.
+
+    sink_rows = sinks[rows]
+    v_rows = v[rows]
+    current = 0
+    p, q = P[0], P[1]
+
+    if dangling == "teleport":
+        t = l * np.sum(p[sinks]) + 1 - l
+    else:
+        t = 1 - l
+
+    try:
+        for iterations in range(maxIterations):
+            q[rows] = l * (M_rows @ p) + t * v_rows
+            partials[0, w] = np.sum(q[rows])
+            barrier.wait()
+
+            if dangling == "renormalize":
+                q[rows] /= np.sum(partials[0])
+            partials[1, w] = np.allclose(p[rows], q[rows], atol=atol)
+            partials[2, w] = np.sum(q[rows][sink_rows])
+            barrier.wait()
+
+            # Every worker reaches the same decision from the shared partials
+            if np.all(partials[1]):
+                break
+
+            if dangling == "teleport":
+                t = l * np.sum(partials[2]) + 1 - l
+
+            p, q = q, p
+            current = 1 - current
+    except BaseException:
+        # Release the workers waiting for this one
+        barrier.abort()
+        raise
+
+    return iterations, current
+
+
+def sharedArray(a: np.ndarray) -> Tuple[SharedMemory, Dict]:
+    # Copy an array to a new shared memory block
+    shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+    np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+    return shm, {"name": shm.name, "shape": a.shape, "dtype": a.dtype.str}
+
+
+def attachArray(spec: Dict) -> Tuple[SharedMemory, np.ndarray]:
+    shm = SharedMemory(name=spec["name"])
+    return shm, np.ndarray(spec["shape"], spec["dtype"], buffer=shm.buf)
+
+
+def processWorker(w: int, bounds: np.ndarray, specs: Dict, barrier, *args):
+    # Entry point of the process backend: attaches to the shared arrays and
+    # iterates its block. Worker 0 stores the result in the shared arrays.
+    shms, arrays = zip(*(attachArray(spec) for spec in specs.values()))
+    arrays = dict(zip(specs, arrays))
+
+    a, b = bounds[w], bounds[w + 1]
+    indptr = arrays["indptr"]
+    s, e = indptr[a], indptr[b]
+    n = len(arrays["v"])
+    M_rows = sparse.csr_matrix(
+        (arrays["data"][s:e], arrays["indices"][s:e], indptr[a : b + 1] - s),
+        shape=(b - a, n),
+    )
+
+    result = iterateBlock(
+        w,
+        slice(a, b),
+        M_rows,
+        arrays["P"],
+        arrays["v"],
+        arrays["sinks"],
+        arrays["partials"],
+        barrier,
+        *args,
+    )
+    if w == 0:
+        arrays["result"][:] = result
+
+    del arrays, M_rows
+    for shm in shms:
+        shm.close()
+
+
+def computePageRanksParallel(
+    M: sparse.csr_matrix,
+    l=0.9,
+    maxIterations=1000,
+    atol=1e-10,
+    dangling="renormalize",
+    personalization: np.ndarray | None = None,
+    p0: np.ndarray | None = None,
+    workers=cpu_count(),
+    backend="thread",
+):
+    # compute the PageRanks of the airports with several workers
+    #
+    # Same parameters and result as PageRank.computePageRanks with the
+    # jacobi solver, plus:
+    # workers: number of blocks of destinations computed in parallel
+    # backend: "thread" (the sparse products release the GIL) or "process"
+    #   (the arrays are placed in shared memory)
+
+    n = M.shape[0]
+    workers = max(1, min(workers, n))
+
+    if personalization is None:
+        v = np.full(n, 1 / n)
+    else:
+        v = personalization / np.sum(personalization)
+
+    if dangling not in ("renormalize", "teleport"):
+        raise ValueError(f"Unknown dangling mode: {dangling}")
+
+    P = np.empty((2, n))
+    P[0] = np.ones(n) / n if p0 is None else p0 / np.sum(p0)
+    partials = np.zeros((3, workers))
+    sinks = danglingNodes(M)
+    bounds = blockBounds(M, workers)
+    args = (l, maxIterations, atol, dangling)
+
+    if backend == "thread":
+        barrier = threading.Barrier(workers)
+        results: List = [None] * workers
+        errors: List[BaseException] = []
+
+        def run(w):
+            a, b = bounds[w], bounds[w + 1]
+            try:
+                results[w] = iterateBlock(
+                    w, slice(a, b), M[a:b], P, v, sinks, partials, barrier, *args
+                )
+            except threading.BrokenBarrierError:
+                pass  # another worker failed
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(w,)) for w in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        iterations, current = results[0]
+        return P[current].copy(), iterations
+
+    elif backend == "process":
+        shared = {
+            "indptr": M.indptr,
+            "indices": M.indices,
+            "data": M.data,
+            "v": v,
+            "sinks": sinks,
+            "P": P,
+            "partials": partials,
+            "result": np.zeros(2, dtype=np.int64),
+        }
+        shms, specs = zip(*(sharedArray(a) for a in shared.values()))
+        specs = dict(zip(shared, specs))
+
+        try:
+            barrier = Barrier(workers)
+            processes = [
+                Process(target=processWorker, args=(w, bounds, specs, barrier, *args))
+                for w in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+            if any(process.exitcode != 0 for process in processes):
+                raise RuntimeError("A PageRank worker failed")
+
+            arrays = dict(zip(shared, shms))
+            P = np.ndarray(P.shape, P.dtype, buffer=arrays["P"].buf)
+            iterations, current = np.ndarray(2, np.int64, buffer=arrays["result"].buf)
+            p = P[current].copy()
+            del P
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+        return p, int(iterations)
+
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--airports",
+        default="airports.txt",
+        help="The file containing the airports data",
+    )
+    parser.add_argument(
+        "--routes",
+        default="routes.txt",
+    )
+    parser.add_argument(
+        "--cache",
+        default=GRAPH_CACHE,
+        help="Directory where the parsed graph is cached between runs",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_const",
+        const=None,
+        help="Always parse the input files",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Parse the input files even if the cache is up to date",
+    )
+    parser.add_argument(
+        "-l", "--damping-factor", type=float, default=0.9, help="The damping factor"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-10,
+        help="The tolerance for the stopping criterion",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=1000,
+        help="The maximum number of iterations",
+    )
+    parser.add_argument(
+        "--dangling",
+        choices=["renormalize", "teleport"],
+        default="renormalize",
+        help="How to redistribute the rank of airports without outgoing routes",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=cpu_count(),
+        help="Number of workers",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="thread",
+        help="Run the workers as threads or as processes",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--top", type=int, default=10, help="The number of top airports to print"
+    )
+    group.add_argument(
+        "--all", action="store_true", help="Print all airports, not just the top ones"
+    )
+
+    args = parser.parse_args()
+
+    graph = readGraph(args.airports, args.routes, args.cache, args.rebuild_cache)
+
+    time1 = time.time()
+    M = graph.transitionMatrix()
+    p, iterations = computePageRanksParallel(
+        M,
+        args.damping_factor,
+        args.max_iterations,
+        args.tolerance,
+        args.dangling,
+        workers=args.workers,
+        backend=args.backend,
+    )
+    time2 = time.time()
+
+    print("#Iterations:", iterations, file=sys.stderr)
+    outputPageRanks(graph, p, len(graph) if args.all else args.top)
+    print("Time of computePageRanksParallel():", time2 - time1, file=sys.stderr)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+# Out-of-core implementation of PageRank.py
+#
+# The routes are converted once into binary edge files (origin, destination
+# and weight arrays in .npy format) sorted by destination. Every iteration
+# then streams them in fixed-size chunks, so only the vectors of size n
+# (ranks, outweights and airport names) and one chunk of edges are kept in
+# memory, regardless of the number of routes.
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import BinaryIO, Dict, Iterator, Tuple
+
+import numpy as np
+import polars as pl
+from PageRank import Graph, inputSignature, outputPageRanks, readAirports
+
+CHUNK_SIZE = 1 << 20  # edges read at a time
+
+EDGE_ARRAYS = {"origin": np.int32, "destination": np.int32, "weight": np.float64}
+
+
+def buildEdgeFiles(airports, routes, edges="edges", chunk_size=CHUNK_SIZE):
+    # Convert the routes file into edge files sorted by destination
+    #
+    # The routes are read in batches. Repeated origin->destination pairs
+    # are grouped within each batch and written, unsorted, to temporary
+    # files while the number of edges of each destination is counted. A
+    # second pass places every edge at its position in the sorted files
+    # (a counting sort), so neither pass needs more than a batch in memory.
+
+    os.makedirs(edges, exist_ok=True)
+
+    # Taken before reading, so inputs changed during the build are stale
+    signature = inputSignature(airports, routes)
+
+    airports = readAirports(airports)
+    n = airports.height
+    ids = (
+        airports.select("code")
+        .with_row_count("id")
+        .unique(subset="code", keep="last")
+        .with_column(pl.col("id").cast(pl.Int32))
+    )
+
+    print(f"Converting Routes file {routes} to {edges}", file=sys.stderr)
+
+    counts = np.zeros(n, dtype=np.int64)  # edges per destination
+    outweight = np.zeros(n)
+    m = 0
+    unknown = 0
+
+    tmp = {name: os.path.join(edges, f"{name}.tmp") for name in EDGE_ARRAYS}
+    files = {name: open(path, "wb") for name, path in tmp.items()}
+    try:
+        reader = pl.read_csv_batched(
+            routes,
+            has_header=False,
+            columns=["column_3", "column_5"],
+            null_values=["\\N", ""],
+            batch_size=chunk_size,
+        )
+        while batches := reader.next_batches(1):
+            for batch in batches:
+                batch = (
+                    batch.rename({"column_3": "origin", "column_5": "destination"})
+                    .groupby(["origin", "destination"])
+                    .agg(pl.count())
+                    .join(ids, left_on="origin", right_on="code", how="left")
+                    .rename({"id": "orig_id"})
+                    .join(ids, left_on="destination", right_on="code", how="left")
+                    .rename({"id": "dest_id"})
+                )
+                known = batch.filter(
+                    pl.col("orig_id").is_not_null() & pl.col("dest_id").is_not_null()
+                )
+                unknown += batch.height - known.height
+
+                origin = known.get_column("orig_id").to_numpy().astype(np.int32)
+                destination = known.get_column("dest_id").to_numpy().astype(np.int32)
+                weight = known.get_column("count").to_numpy().astype(np.float64)
+
+                files["origin"].write(origin.tobytes())
+                files["destination"].write(destination.tobytes())
+                files["weight"].write(weight.tobytes())
+
+                counts += np.bincount(destination, minlength=n)
+                outweight += np.bincount(origin, weights=weight, minlength=n)
+                m += len(weight)
+    finally:
+        for f in files.values():
+            f.close()
+
+    print(f"There were {unknown} routes with unknown airports")
+    print(f"There were {m} added routes")
+
+    # Counting sort by destination: cursor holds the next free position of
+    # each destination in the sorted files
+    cursor = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    sources = {
+        name: np.memmap(path, dtype=EDGE_ARRAYS[name], mode="r", shape=(m,))
+        for name, path in tmp.items()
+    }
+    sorted_arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(edges, f"{name}.npy"), mode="w+", dtype=dtype, shape=(m,)
+        )
+        for name, dtype in EDGE_ARRAYS.items()
+    }
+
+    for start in range(0, m, chunk_size):
+        end = min(start + chunk_size, m)
+        destination = np.asarray(sources["destination"][start:end])
+
+        order = np.argsort(destination, kind="stable")
+        d = destination[order]
+        # Position of each edge among the edges of its destination in the chunk
+        first = np.searchsorted(d, d, side="left")
+        positions = cursor[d] + np.arange(len(d)) - first
+        cursor += np.bincount(d, minlength=n)
+
+        for name in EDGE_ARRAYS:
+            sorted_arrays[name][positions] = np.asarray(sources[name][start:end])[order]
+
+    for name in EDGE_ARRAYS:
+        sorted_arrays[name].flush()
+    del sources, sorted_arrays
+    for path in tmp.values():
+        os.remove(path)
+
+    np.save(os.path.join(edges, "outweight.npy"), outweight)
+    np.save(
+        os.path.join(edges, "codes.npy"),
+        np.array(airports.get_column("code").to_list(), dtype=str),
+    )
+    np.save(
+        os.path.join(edges, "names.npy"),
+        np.array(["" if x is None else x for x in airports.get_column("name")], str),
+    )
+    with open(os.path.join(edges, "meta.json"), "w") as f:
+        json.dump(
+            {"airports": n, "routes": m, "chunk_size": chunk_size, "inputs": signature},
+            f,
+        )
+
+
+def readEdgeMeta(edges="edges") -> Dict:
+    with open(os.path.join(edges, "meta.json")) as f:
+        return json.load(f)
+
+
+def edgeFilesCurrent(airports, routes, edges="edges") -> bool:
+    # Whether the edge files were built from the current input files, as
+    # the graph cache of PageRank.readGraph
+    try:
+        return readEdgeMeta(edges)["inputs"] == inputSignature(airports, routes)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def openEdgeArray(edges: str, name: str) -> BinaryIO:
+    # Open an edge file positioned at the start of its data
+    f = open(os.path.join(edges, f"{name}.npy"), "rb")
+    if np.lib.format.read_magic(f) == (1, 0):
+        np.lib.format.read_array_header_1_0(f)
+    else:
+        np.lib.format.read_array_header_2_0(f)
+    return f
+
+
+def streamEdges(
+    edges: str, m: int, chunk_size=CHUNK_SIZE
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    # Yield the (origin, destination, weight) arrays of the edges in chunks
+    #
+    # The same buffers are reused for every chunk, so the consumer must not
+    # keep references to them.
+    opened = {name: openEdgeArray(edges, name) for name in EDGE_ARRAYS}
+    buffers = {
+        name: np.empty(min(chunk_size, m), dtype=dtype)
+        for name, dtype in EDGE_ARRAYS.items()
+    }
+    try:
+        for start in range(0, m, chunk_size):
+            size = min(chunk_size, m - start)
+            for name, f in opened.items():
+                f.readinto(memoryview(buffers[name][:size]).cast("B"))
+            yield tuple(buffers[name][:size] for name in EDGE_ARRAYS)
+    finally:
+        for f in opened.values():
+            f.close()
+
+
+def computePageRanksStreaming(
+    edges="edges",
+    l=0.9,
+    maxIterations=1000,
+    atol=1e-10,
+    dangling="renormalize",
+    chunk_size=CHUNK_SIZE,
+):
+    # compute the PageRanks of the airports streaming the edge files
+    #
+    # Same parameters and result as PageRank.computePageRanks with the
+    # jacobi solver, plus:
+    # edges: directory written by buildEdgeFiles
+    # chunk_size: number of edges read at a time
+
+    meta = readEdgeMeta(edges)
+    n, m = meta["airports"], meta["routes"]
+
+    if dangling not in ("renormalize", "teleport"):
+        raise ValueError(f"Unknown dangling mode: {dangling}")
+
+    outweight = np.load(os.path.join(edges, "outweight.npy"))
+    sinks = outweight == 0
+    # inverse of the outweight, 0 for sinks
+    inv_outweight = np.divide(1, outweight, out=np.zeros(n), where=~sinks)
+
+    p = np.ones(n) / n  # initial probability vector
+    q = np.empty(n)
+    r = np.empty(n)
+    for iterations in range(maxIterations):
+        # rank sent along each unit of weight of the routes of each airport
+        np.multiply(p, inv_outweight, out=r)
+
+        q[:] = 0
+        for origin, destination, weight in streamEdges(edges, m, chunk_size):
+            # Edges are sorted by destination, so each chunk only touches
+            # a contiguous range of q
+            first, last = destination[0], destination[-1] + 1
+            q[first:last] += np.bincount(
+                destination - first, weights=weight * r[origin], minlength=last - first
+            )
+
+        q *= l
+        if dangling == "teleport":
+            q += (l * np.sum(p[sinks]) + 1 - l) / n
+        else:
+            q += (1 - l) / n
+            q /= np.sum(q)
+
+        # Check convergence
+        if np.allclose(p, q, atol=atol):
+            break  # equal within tolerance, stop iterating
+
+        p, q = q, p
+
+    return p, iterations
+
+
+def readEdgeGraph(edges="edges") -> Graph:
+    # Graph with the airports of the edge files and no routes, for output
+    empty = np.empty(0, dtype=np.int64)
+    return Graph(
+        np.load(os.path.join(edges, "codes.npy")).astype(object),
+        np.load(os.path.join(edges, "names.npy")).astype(object),
+        empty,
+        empty,
+        empty.astype(np.float64),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--airports",
+        default="airports.txt",
+        help="The file containing the airports data",
+    )
+    parser.add_argument(
+        "--routes",
+        default="routes.txt",
+    )
+    parser.add_argument(
+        "--edges",
+        default="edges",
+        help="Directory with the binary edge files, built from the routes "
+        "if it does not exist or the input files have changed",
+    )
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the edge files")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Number of edges read at a time",
+    )
+    parser.add_argument(
+        "-l", "--damping-factor", type=float, default=0.9, help="The damping factor"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-10,
+        help="The tolerance for the stopping criterion",
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=1000,
+        help="The maximum number of iterations",
+    )
+    parser.add_argument(
+        "--dangling",
+        choices=["renormalize", "teleport"],
+        default="renormalize",
+        help="How to redistribute the rank of airports without outgoing routes",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--top", type=int, default=10, help="The number of top airports to print"
+    )
+    group.add_argument(
+        "--all", action="store_true", help="Print all airports, not just the top ones"
+    )
+
+    args = parser.parse_args()
+
+    if args.rebuild or not edgeFilesCurrent(args.airports, args.routes, args.edges):
+        buildEdgeFiles(args.airports, args.routes, args.edges, args.chunk_size)
+
+    time1 = time.time()
+    p, iterations = computePageRanksStreaming(
+        args.edges,
+        args.damping_factor,
+        args.max_iterations,
+        args.tolerance,
+        args.dangling,
+        args.chunk_size,
+    )
+    time2 = time.time()
+
+    print("#Iterations:", iterations, file=sys.stderr)
+    graph = readEdgeGraph(args.edges)
+    outputPageRanks(graph, p, len(graph) if args.all else args.top)
+    print("Time of computePageRanksStreaming():", time2 - time1, file=sys.stderr)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Binary PageRank results
+#
+# A rank file is a .npy structured array with one record per airport: its
+# IATA code and rank, the airport at that position of the descending order
+# and the position of the airport in that order. Readers memory-map it, so
+# looking up an airport needs neither parsing text nor loading the graph,
+# and this module only depends on numpy.
+
+from __future__ import annotations
+
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def rankOrder(p: np.ndarray) -> np.ndarray:
+    # Airports by descending rank, ties in the order of the airports
+    return np.argsort(-p, kind="stable")
+
+
+def writeRankFile(
+    path: str, codes: np.ndarray, p: np.ndarray, order: np.ndarray | None = None
+):
+    # Write the ranks p of the airports with the given codes
+    #
+    # order: rankOrder(p), if it is already computed
+    n = len(p)
+    if order is None:
+        order = rankOrder(p)
+
+    encoded = np.array([code.encode() for code in codes])
+    records = np.empty(
+        n,
+        dtype=[
+            ("code", encoded.dtype),
+            ("rank", np.float64),
+            ("order", np.int64),
+            ("position", np.int64),
+        ],
+    )
+    records["code"] = encoded
+    records["rank"] = p
+    records["order"] = order
+    records["position"][order] = np.arange(n)
+    np.save(path, records)
+
+
+class RankFile:
+    # Read-only view of a rank file
+    #
+    # The records are memory-mapped; only the code -> airport dictionary is
+    # built when the file is opened, so every lookup takes constant time.
+    # Repeated codes resolve to the last airport with that code, as in
+    # PageRank.Graph.
+
+    def __init__(self, path: str):
+        self.records = np.load(path, mmap_mode="r")
+        self.index: Dict[str, int] = {
+            code.decode(): i for i, code in enumerate(self.records["code"])
+        }
+
+    def __len__(self):
+        return len(self.records)
+
+    def rank(self, code: str) -> float:
+        return float(self.records["rank"][self.index[code]])
+
+    def position(self, code: str) -> int:
+        # Position of the airport in the descending order, from 0
+        return int(self.records["position"][self.index[code]])
+
+    def percentile(self, code: str) -> float:
+        # Percentage of the airports ranked at or below this one
+        return 100 * (len(self) - self.position(code)) / len(self)
+
+    def top(self, n=10) -> List[Tuple[str, float]]:
+        # Codes and ranks of the n airports with the highest ranks
+        records = self.records[self.records["order"][:n]]
+        return [
+            (code.decode(), float(rank))
+            for code, rank in zip(records["code"], records["rank"])
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ranks", help="Rank file written by PageRank.py --export")
+    parser.add_argument("codes", nargs="*", help="IATA codes of the airports to show")
+    parser.add_argument(
+        "--top", type=int, default=10, help="The number of top airports to print"
+    )
+
+    args = parser.parse_args()
+    ranks = RankFile(args.ranks)
+
+    for code in args.codes:
+        print(
+            f"{code}\t{ranks.rank(code):.6f}\t#{ranks.position(code) + 1}"
+            f"\t{ranks.percentile(code):.2f}%"
+        )
+    if not args.codes:
+        for code, rank in ranks.top(args.top):
+            print(f"{rank:.6f}\t{code}")
@@ -1,12 +1,563 @@
 #!/usr/bin/env python3
 
 import argparse
+import csv
+import json
+import os
+import platform
+import sys
 import time
-from collections import defaultdict
+from itertools import product
+from multiprocessing import Pool, Queue
+from typing import Callable, Dict, Iterator, List, Tuple
 
 import numpy as np
 import polars as pl
-from PageRank import computePageRanks, readAirports, readRoutes
+import scipy
+from Centrality import (
+    MEASURES,
+    computeEigenvectorCentrality,
+    computeHITS,
+    computeKatzCentrality,
+)
+from PageRank import (
+    GRAPH_CACHE,
+    SOLVERS,
+    Graph,
+    Trace,
+    computePageRanks,
+    computePageRanksSingle,
+    danglingNodes,
+    readGraph,
+)
+from PageRank_par import (
+    BACKENDS,
+    attachArray,
+    computePageRanksParallel,
+    sharedArray,
+)
+from scipy import sparse
+from synthetic import scaleFreeGraph
+
+# Parameters that identify a cell of the benchmark grid
+KEYS = ["graph", "measure", "damping", "tolerance", "dangling", "solver", "workers"]
+
+# Columns of the CSV files, the ones of the previous versions of this
+# script come first
+COLUMNS = [
+    "damping",
+    "tolerance",
+    "iterations",
+    "time",
+    "p_min",
+    "p_25",
+    "p_50",
+    "p_75",
+    "p_max",
+    "dangling",
+    "solver",
+    "workers",
+    "graph",
+    "repetition",
+    "time_ns",
+    "ns_per_iteration",
+    "measure",
+    "l1_error",
+]
+
+# Exit status of --compare when a regression is found
+REGRESSION_STATUS = 1
+
+# Top airports whose order is compared by --accuracy
+ACCURACY_TOP = 100
+
+# L1 change of the ranks at which the reference PageRanks stop
+REFERENCE_TOLERANCE = 1e-14
+
+
+def benchmarkGraphs(args) -> Iterator[Tuple[str, Callable[[], Graph]]]:
+    # Names of the graphs to benchmark and functions that build them, so
+    # that graphs are only built when needed
+    if not args.skip_airports:
+        yield "airports", lambda: readGraph(
+            args.airports, args.routes, args.cache, args.rebuild_cache
+        )
+
+    for n in args.synthetic:
+
+        def build(n=n):
+            graph = scaleFreeGraph(n, args.edges_per_node, seed=args.seed)
+            print(f"synthetic-{n}: {graph}", file=sys.stderr)
+            return graph
+
+        yield f"synthetic-{n}", build
+
+
+def graphMatrices(graph: Graph) -> Dict[str, sparse.csr_matrix]:
+    # Matrices used by the measures: PageRank iterates the transition
+    # matrix, the other centralities the adjacency matrix
+    return {
+        "transition": graph.transitionMatrix(),
+        "adjacency": graph.adjacencyMatrix(),
+    }
+
+
+def gridCells(args) -> Iterator[Dict]:
+    # Parameter combinations of the grid for one graph
+    #
+    # Only PageRank has dangling modes, solvers and workers, and only
+    # PageRank and Katz (as its attenuation) use the damping values
+    for measure in args.measure:
+        if measure != "pagerank":
+            dampings = args.damping if measure == "katz" else [None]
+            for damping, atol in product(dampings, args.tolerance):
+                yield {
+                    "measure": measure,
+                    "damping": damping,
+                    "tolerance": atol,
+                    "dangling": None,
+                    "solver": None,
+                    "workers": 1,
+                }
+            continue
+
+        for damping, atol, dangling, solver, workers in product(
+            args.damping, args.tolerance, args.dangling, args.solver, args.workers
+        ):
+            if workers > 1 and solver != "jacobi":
+                continue  # PageRank_par only implements the jacobi solver
+            yield {
+                "measure": measure,
+                "damping": damping,
+                "tolerance": atol,
+                "dangling": dangling,
+                "solver": solver,
+                "workers": workers,
+            }
+
+
+def runCell(
+    matrices: Dict[str, sparse.csr_matrix], cell: Dict, args
+) -> Tuple[np.ndarray, int]:
+    # Scores and iterations of the measure of a cell (authorities for HITS)
+    A = matrices["adjacency"]
+    if cell["measure"] == "hits":
+        _, a, iterations = computeHITS(A, args.max_iterations, cell["tolerance"])
+        return a, iterations
+    if cell["measure"] == "katz":
+        return computeKatzCentrality(
+            A, cell["damping"], args.max_iterations, cell["tolerance"]
+        )
+    if cell["measure"] == "eigenvector":
+        return computeEigenvectorCentrality(A, args.max_iterations, cell["tolerance"])
+    return runPageRank(matrices["transition"], cell, args)
+
+
+def runPageRank(
+    M: sparse.csr_matrix, cell: Dict, args, callback=None
+) -> Tuple[np.ndarray, int]:
+    if cell["workers"] > 1:
+        return computePageRanksParallel(
+            M,
+            cell["damping"],
+            args.max_iterations,
+            cell["tolerance"],
+            cell["dangling"],
+            workers=cell["workers"],
+            backend=args.backend,
+        )
+    return computePageRanks(
+        M,
+        cell["damping"],
+        args.max_iterations,
+        cell["tolerance"],
+        cell["dangling"],
+        solver=cell["solver"],
+        callback=callback,
+    )
+
+
+# Reference PageRanks of each graph, damping and dangling mode
+_references: Dict[Tuple, np.ndarray] = {}
+
+
+def referencePageRank(
+    M: sparse.csr_matrix, l: float, dangling: str, maxIterations=100000
+) -> np.ndarray:
+    # PageRanks iterated until the L1 change of the ranks is below
+    # REFERENCE_TOLERANCE. The allclose test of computePageRanks is mostly
+    # relative (1e-5 of each rank) and the solvers stop at different
+    # distances from the fixed point, so their results are compared with
+    # this one.
+    n = M.shape[0]
+    sinks = danglingNodes(M)
+    p = np.full(n, 1 / n)
+    for _ in range(maxIterations):
+        t = 1 - l
+        if dangling == "teleport":
+            t += l * np.sum(p[sinks])
+        q = l * (M @ p) + t / n
+        q /= np.sum(q)
+        if np.sum(np.abs(q - p)) < REFERENCE_TOLERANCE:
+            return q
+        p = q
+    print(
+        f"Reference PageRank (l={l}, dangling={dangling}) did not converge after "
+        f"{maxIterations} iterations, the errors are measured against it anyway",
+        file=sys.stderr,
+    )
+    return p
+
+
+def referenceKey(cell: Dict) -> Tuple:
+    return cell["graph"], cell["damping"], cell["dangling"]
+
+
+def computeReferences(M: sparse.csr_matrix, cells: List[Dict]) -> List[Tuple]:
+    # Compute the missing reference PageRanks of some cells, returns their
+    # keys
+    keys = sorted(
+        {referenceKey(cell) for cell in cells if cell["measure"] == "pagerank"}
+    )
+    for key in keys:
+        if key not in _references:
+            _references[key] = referencePageRank(M, key[1], key[2])
+    return keys
+
+
+def pageRankError(M: sparse.csr_matrix, cell: Dict, p: np.ndarray) -> float:
+    # L1 distance of the PageRanks of a cell to the reference ones
+    key = referenceKey(cell)
+    if key not in _references:
+        _references[key] = referencePageRank(M, cell["damping"], cell["dangling"])
+    return float(np.sum(np.abs(p - _references[key])))
+
+
+def measureCell(matrices: Dict[str, sparse.csr_matrix], cell: Dict, args) -> List[Dict]:
+    # Time the repetitions of a cell after the warm-up runs
+    for _ in range(args.warmup):
+        runCell(matrices, cell, args)
+
+    runs = []
+    for repetition in range(args.repetitions):
+        time1 = time.perf_counter_ns()
+        p, iterations = runCell(matrices, cell, args)
+        time2 = time.perf_counter_ns()
+
+        p_q = np.quantile(p, [0, 0.25, 0.5, 0.75, 1])
+        if cell["measure"] == "pagerank":
+            error = pageRankError(matrices["transition"], cell, p)
+        else:
+            error = None
+
+        runs.append(
+            {
+                **cell,
+                "repetition": repetition,
+                "iterations": int(iterations),
+                "time": (time2 - time1) / 1e9,
+                "time_ns": time2 - time1,
+                # iterations are counted from 0
+                "ns_per_iteration": (time2 - time1) / (iterations + 1),
+                "p_min": p_q[0],
+                "p_25": p_q[1],
+                "p_50": p_q[2],
+                "p_75": p_q[3],
+                "p_max": p_q[4],
+                "l1_error": error,
+            }
+        )
+
+    if args.trace and cell["measure"] == "pagerank" and cell["workers"] == 1:
+        traceCell(matrices["transition"], cell, args)
+
+    return runs
+
+
+def traceCell(M: sparse.csr_matrix, cell: Dict, args):
+    # Trace the iterations of one more run of a PageRank cell, outside the
+    # measured repetitions
+    trace = Trace()
+    runPageRank(M, cell, args, trace)
+    trace.stop()
+
+    name = "_".join(str(cell[key]) for key in KEYS)
+    os.makedirs(args.trace, exist_ok=True)
+    trace.write(os.path.join(args.trace, f"{name}.csv"))
+
+
+def summarize(runs: List[Dict], confidence=0.95, resamples=2000) -> Dict:
+    # Robust statistics of the times of the runs of one cell
+    #
+    # The confidence interval of the median is estimated by bootstrap.
+    t = np.array([run["time_ns"] for run in runs], dtype=np.float64)
+    q25, median, q75 = np.quantile(t, [0.25, 0.5, 0.75])
+
+    rng = np.random.default_rng(0)
+    medians = np.median(rng.choice(t, (resamples, len(t))), axis=1)
+    ci_low, ci_high = np.quantile(medians, [(1 - confidence) / 2, (1 + confidence) / 2])
+
+    return {
+        **{key: runs[0][key] for key in KEYS},
+        "runs": len(t),
+        "iterations": int(np.median([run["iterations"] for run in runs])),
+        "median_ns": median,
+        "q25_ns": q25,
+        "q75_ns": q75,
+        "iqr_ns": q75 - q25,
+        "ci_low_ns": ci_low,
+        "ci_high_ns": ci_high,
+        "mean_ns": np.mean(t),
+        "median_ns_per_iteration": np.median([run["ns_per_iteration"] for run in runs]),
+        "l1_error": runs[0]["l1_error"],
+    }
+
+
+def printSummary(summary: Dict):
+    print(
+        ", ".join(f"{key}: {summary[key]}" for key in KEYS)
+        + f", iterations: {summary['iterations']}"
+        + f", median: {summary['median_ns'] / 1e6:.3f} ms"
+        + f" [{summary['ci_low_ns'] / 1e6:.3f}, {summary['ci_high_ns'] / 1e6:.3f}]"
+        + f", IQR: {summary['iqr_ns'] / 1e6:.3f} ms"
+        + (
+            f", L1 error: {summary['l1_error']:.1e}"
+            if summary["l1_error"] is not None
+            else ""
+        )
+    )
+
+
+def environment(args) -> Dict:
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+
+def writeResults(runs: List[Dict], summaries: List[Dict], args):
+    df = pl.DataFrame(runs).select(COLUMNS)
+    df.write_csv("results_all.csv")
+    df.groupby(KEYS).mean().select(COLUMNS).drop("repetition").write_csv("results.csv")
+
+    with open(args.json, "w") as f:
+        json.dump(
+            {"environment": environment(args), "summary": summaries, "runs": runs},
+            f,
+            indent=1,
+        )
+
+
+def cellKey(cell: Dict) -> Tuple:
+    # Results written before the other centralities were added are PageRank
+    return tuple(
+        cell.get(key, "pagerank") if key == "measure" else cell[key] for key in KEYS
+    )
+
+
+def readCheckpoint(checkpoint: str) -> Dict[Tuple, List[Dict]]:
+    # Runs of the cells completed by a previous sweep, one cell per line
+    done = {}
+    try:
+        with open(checkpoint) as f:
+            for line in f:
+                try:
+                    cell_runs = json.loads(line)
+                except ValueError:
+                    break  # line cut short when the sweep was killed
+                for run in cell_runs:
+                    run.setdefault("l1_error", None)  # not measured before
+                done[cellKey(cell_runs[0])] = cell_runs
+    except FileNotFoundError:
+        pass
+    return done
+
+
+# State of the workers of the --jobs pool
+_worker: Dict = {}
+
+
+def availableCPUs() -> List[int]:
+    # CPUs this process can run on (all of them where the affinity can not
+    # be read, as on macOS)
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def initWorker(
+    specs: Dict,
+    shape: Tuple[int, int],
+    references: Tuple[List[Tuple], Dict | None],
+    cpus,
+    args,
+):
+    # Pin the worker to its own CPU (where the affinity can be set) and
+    # attach to the shared graph arrays and reference PageRanks
+    cpu = cpus.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+    _worker["shms"] = []
+    _worker["matrices"] = {}
+    for name, matrix_specs in specs.items():
+        shms, arrays = zip(*(attachArray(spec) for spec in matrix_specs))
+        _worker["shms"].extend(shms)
+        _worker["matrices"][name] = sparse.csr_matrix(tuple(arrays), shape=shape)
+    keys, spec = references
+    if spec is not None:
+        shm, R = attachArray(spec)
+        _worker["shms"].append(shm)
+        _references.update(zip(keys, R))
+    _worker["args"] = args
+
+
+def measureSharedCell(cell: Dict) -> List[Dict]:
+    return measureCell(_worker["matrices"], cell, _worker["args"])
+
+
+def measureCells(
+    matrices: Dict[str, sparse.csr_matrix], cells: List[Dict], args
+) -> Iterator[List[Dict]]:
+    # Runs of each cell, in the order they finish
+    if args.jobs == 1:
+        for cell in cells:
+            yield measureCell(matrices, cell, args)
+        return
+
+    cpus = availableCPUs()[: args.jobs]
+    queue: Queue = Queue()
+    for cpu in cpus:
+        queue.put(cpu)
+
+    # The graph and the reference PageRanks are published once, the workers
+    # only receive the cells
+    keys = computeReferences(matrices["transition"], cells)
+    shms = []
+    specs: Dict[str, List[Dict]] = {}
+    for name, M in matrices.items():
+        specs[name] = []
+        for a in (M.data, M.indices, M.indptr):
+            shm, spec = sharedArray(a)
+            shms.append(shm)
+            specs[name].append(spec)
+    reference_spec = None
+    if keys:
+        shm, reference_spec = sharedArray(np.stack([_references[k] for k in keys]))
+        shms.append(shm)
+    try:
+        with Pool(
+            len(cpus),
+            initializer=initWorker,
+            initargs=(
+                specs,
+                matrices["transition"].shape,
+                (keys, reference_spec),
+                queue,
+                args,
+            ),
+        ) as pool:
+            yield from pool.imap_unordered(measureSharedCell, cells)
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+
+def accuracyReport(args) -> List[Dict]:
+    # Error of the single precision PageRank, with and without its double
+    # precision refinement, against double precision for every damping
+    # value, tolerance and dangling mode of the grid
+    rows = []
+    for name, build in benchmarkGraphs(args):
+        M = build().transitionMatrix()
+        for damping, atol, dangling in product(
+            args.damping, args.tolerance, args.dangling
+        ):
+            time1 = time.perf_counter_ns()
+            p, iterations = computePageRanks(
+                M, damping, args.max_iterations, atol, dangling
+            )
+            time2 = time.perf_counter_ns()
+            top = np.argsort(-p, kind="stable")[:ACCURACY_TOP]
+
+            for refine in (False, True):
+                time3 = time.perf_counter_ns()
+                q, single_iterations = computePageRanksSingle(
+                    M, damping, args.max_iterations, atol, dangling, refine=refine
+                )
+                time4 = time.perf_counter_ns()
+
+                error = np.abs(q - p)
+                row = {
+                    "graph": name,
+                    "damping": damping,
+                    "tolerance": atol,
+                    "dangling": dangling,
+                    "precision": "single+refine" if refine else "single",
+                    "iterations": int(single_iterations),
+                    "time_ns": time4 - time3,
+                    "double_iterations": int(iterations),
+                    "double_time_ns": time2 - time1,
+                    "l1_error": np.sum(error),
+                    "max_error": np.max(error),
+                    "max_relative_error": np.max(error / p),
+                    # Fraction of the top positions holding the same airport
+                    "top_agreement": np.mean(
+                        np.argsort(-q, kind="stable")[:ACCURACY_TOP] == top
+                    ),
+                }
+                rows.append(row)
+                print(", ".join(f"{key}: {value}" for key, value in row.items()))
+
+    pl.DataFrame(rows).write_csv("accuracy.csv")
+    return rows
+
+
+def compareResults(old: str, new: str, threshold=0.05) -> int:
+    # Compare the summaries of two JSON result files
+    #
+    # A cell regresses when its median time grows more than threshold and
+    # the confidence intervals of both medians do not overlap. Returns the
+    # number of regressions.
+    with open(old) as f:
+        before = {cellKey(s): s for s in json.load(f)["summary"]}
+    with open(new) as f:
+        after = json.load(f)["summary"]
+
+    regressions = 0
+    for s in after:
+        o = before.get(cellKey(s))
+        if o is None:
+            continue
+
+        ratio = s["median_ns"] / o["median_ns"]
+        if ratio > 1 + threshold and s["ci_low_ns"] > o["ci_high_ns"]:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold and s["ci_high_ns"] < o["ci_low_ns"]:
+            verdict = "improvement"
+        else:
+            verdict = "same"
+
+        if s["iterations"] != o["iterations"]:
+            verdict += f" (iterations {o['iterations']} -> {s['iterations']})"
+
+        print(
+            ", ".join(f"{key}: {s[key]}" for key in KEYS)
+            + f", {o['median_ns'] / 1e6:.3f} ms -> {s['median_ns'] / 1e6:.3f} ms"
+            + f" (x{ratio:.3f}): {verdict}"
+        )
+
+    print(f"{regressions} regressions", file=sys.stderr)
+    return regressions
+
 
 if __name__ == "__main__":
 
@@ -20,6 +571,44 @@ if __name__ == "__main__":
         "--routes",
         default="routes.txt",
     )
+    parser.add_argument(
+        "--cache",
+        default=GRAPH_CACHE,
+        help="Directory where the parsed graph is cached between runs",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_const",
+        const=None,
+        help="Always parse the input files",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Parse the input files even if the cache is up to date",
+    )
+    parser.add_argument(
+        "--skip-airports",
+        action="store_true",
+        help="Only benchmark the synthetic graphs",
+    )
+    parser.add_argument(
+        "--synthetic",
+        help="Sizes of the synthetic scale-free graphs to benchmark",
+        type=int,
+        nargs="+",
+        default=[],
+    )
+    parser.add_argument(
+        "--edges-per-node",
+        help="Average out-degree of the synthetic graphs",
+        type=float,
+        default=8,
+    )
+    parser.add_argument(
+        "--seed", help="Seed of the synthetic graphs", type=int, default=0
+    )
     parser.add_argument(
         "-r",
         "--repetitions",
@@ -27,6 +616,13 @@ if __name__ == "__main__":
         type=int,
         default=5,
     )
+    parser.add_argument(
+        "-w",
+        "--warmup",
+        help="Number of unmeasured runs before the repetitions",
+        type=int,
+        default=1,
+    )
     parser.add_argument(
         "-l",
         "--damping",
@@ -49,33 +645,163 @@ if __name__ == "__main__":
         default=1000,
         help="The maximum number of iterations",
     )
+    parser.add_argument(
+        "--measure",
+        help="Centralities to test (the damping values are the attenuation of Katz)",
+        nargs="+",
+        choices=["pagerank"] + MEASURES,
+        default=["pagerank"],
+    )
+    parser.add_argument(
+        "--dangling",
+        help="Modes to test for the rank of airports without outgoing routes",
+        nargs="+",
+        choices=["renormalize", "teleport"],
+        default=["renormalize", "teleport"],
+    )
+    parser.add_argument(
+        "--solver",
+        help="Solvers to test",
+        nargs="+",
+        choices=SOLVERS,
+        default=["jacobi"],
+    )
+    parser.add_argument(
+        "--workers",
+        help="Numbers of workers to test with PageRank_par (jacobi solver only)",
+        type=int,
+        nargs="+",
+        default=[1],
+    )
+    parser.add_argument(
+        "--backend",
+        help="How to run the workers of PageRank_par",
+        choices=BACKENDS,
+        default="thread",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of cells of the grid measured in parallel, each one by a "
+        "worker pinned to its own CPU",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="File where the completed cells are stored while the sweep runs",
+        default="results.checkpoint",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the cells completed in the checkpoint of a killed sweep",
+    )
+    group.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Discard the checkpoint of a previous sweep and start again",
+    )
+    parser.add_argument(
+        "--confidence",
+        help="Confidence level of the intervals of the median times",
+        type=float,
+        default=0.95,
+    )
+    parser.add_argument(
+        "--json",
+        help="File where the runs and their summary are written",
+        default="results.json",
+    )
+    parser.add_argument(
+        "--compare",
+        help="Compare two JSON result files instead of running the benchmark",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+    )
+    parser.add_argument(
+        "--trace",
+        help="Directory where the per-iteration trace of one extra run of each "
+        "PageRank cell is written",
+    )
+    parser.add_argument(
+        "--accuracy",
+        action="store_true",
+        help="Report the error of single precision PageRank against double "
+        "precision to accuracy.csv instead of running the benchmark",
+    )
+    parser.add_argument(
+        "--threshold",
+        help="Relative slowdown of the median considered a regression",
+        type=float,
+        default=0.05,
+    )
     args = parser.parse_args()
 
-    readAirports(args.airports)
-    readRoutes(args.routes)
+    if args.compare:
+        regressions = compareResults(*args.compare, args.threshold)
+        sys.exit(REGRESSION_STATUS if regressions else 0)
 
-    results = defaultdict(list)
+    if args.accuracy:
+        accuracyReport(args)
+        sys.exit(0)
 
-    for damping in args.damping:
-        for atol in args.tolerance:
-            for _ in range(args.repetitions):
-                time1 = time.time()
-                p, iterations = computePageRanks(damping, args.max_iterations, atol)
-                time2 = time.time()
+    if args.jobs > 1 and any(workers > 1 for workers in args.workers):
+        parser.error("--jobs can not be combined with --workers greater than 1")
+    if args.jobs > 1 and args.jobs > len(availableCPUs()):
+        parser.error("--jobs can not be greater than the number of available CPUs")
+    if os.path.exists(args.checkpoint) and not (args.resume or args.overwrite):
+        parser.error(
+            f"The checkpoint {args.checkpoint} of a previous sweep exists, use "
+            "--resume to continue it or --overwrite to discard it"
+        )
 
-                p_q = np.quantile(p, [0, 0.25, 0.5, 0.75, 1])
+    # Cells of a previous sweep, skipped when resuming
+    done = readCheckpoint(args.checkpoint) if args.resume else {}
+    runs: List[Dict] = [run for cell_runs in done.values() for run in cell_runs]
 
-                results["damping"].append(damping)
-                results["tolerance"].append(atol)
-                results["iterations"].append(iterations)
-                results["time"].append(time2 - time1)
-                results["p_min"].append(p_q[0])
-                results["p_25"].append(p_q[1])
-                results["p_50"].append(p_q[2])
-                results["p_75"].append(p_q[3])
-                results["p_max"].append(p_q[4])
-            print("damping: {}, tolerance: {}".format(damping, atol))
+    # Runs are streamed to the CSV file and the checkpoint as cells finish
+    with open("results_all.csv", "w", newline="") as stream, open(
+        args.checkpoint, "a" if args.resume else "w"
+    ) as checkpoint:
+        writer = csv.DictWriter(stream, COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(runs)
 
-    df = pl.DataFrame(results)
-    df.write_csv("results_all.csv")
-    df.groupby(["damping", "tolerance"]).mean().write_csv("results.csv")
+        for name, build in benchmarkGraphs(args):
+            cells = [
+                {"graph": name, **cell}
+                for cell in gridCells(args)
+                if cellKey({"graph": name, **cell}) not in done
+            ]
+            if not cells:
+                continue
+
+            matrices = graphMatrices(build())
+            for cell_runs in measureCells(matrices, cells, args):
+                writer.writerows(cell_runs)
+                stream.flush()
+                checkpoint.write(json.dumps(cell_runs) + "\n")
+                checkpoint.flush()
+
+                printSummary(summarize(cell_runs, args.confidence))
+                runs.extend(cell_runs)
+
+    # Summaries in the order of the grid, whatever order cells finished in
+    by_cell: Dict[Tuple, List[Dict]] = {}
+    for run in runs:
+        by_cell.setdefault(cellKey(run), []).append(run)
+    grid = [
+        cellKey({"graph": name, **cell})
+        for name, _ in benchmarkGraphs(args)
+        for cell in gridCells(args)
+    ]
+    position = {key: i for i, key in enumerate(grid)}
+    summaries = [
+        summarize(by_cell[key], args.confidence)
+        for key in sorted(by_cell, key=lambda key: position.get(key, len(grid)))
+    ]
+
+    writeResults(runs, summaries, args)
+    os.remove(args.checkpoint)
@@ -0,0 +1,43 @@
+# Synthetic scale-free graphs to benchmark PageRank beyond the airports data
+#
+# Graphs follow the Chung-Lu model: every node gets an expected out-degree
+# and in-degree from a power law, and each edge picks its origin and its
+# destination independently, proportionally to them. Repeated edges are
+# grouped as weights, like repeated routes in PageRank.readRoutes.
+
+from __future__ import annotations
+
+import numpy as np
+from PageRank import Graph
+
+
+def scaleFreeGraph(
+    n: int, edgesPerNode: float = 8, exponent: float = 2.1, seed: int = 0
+) -> Graph:
+    # Directed graph with n nodes, about n * edgesPerNode edges and degrees
+    # following a power law with the given exponent
+    rng = np.random.default_rng(seed)
+
+    m = int(n * edgesPerNode)
+    degrees = np.arange(1, n + 1) ** (-1 / (exponent - 1))
+
+    out_degrees = rng.permutation(degrees)
+    in_degrees = rng.permutation(degrees)
+    origin = rng.choice(n, m, p=out_degrees / np.sum(out_degrees))
+    destination = rng.choice(n, m, p=in_degrees / np.sum(in_degrees))
+
+    # Drop self loops and group repeated edges, sorted by destination
+    loops = origin == destination
+    keys, weight = np.unique(
+        destination[~loops] * n + origin[~loops], return_counts=True
+    )
+
+    codes = np.array([f"N{i}" for i in range(n)], dtype=object)
+    return Graph(
+        codes,
+        codes.copy(),
+        keys % n,
+        keys // n,
+        weight.astype(np.float64),
+        np.full(n, "Synthetic", dtype=object),
+    )
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+import polars as pl
+import pytest
+from PageRank import (
+    Graph,
+    applyRouteDelta,
+    computeDampedPageRanks,
+    computePageRanks,
+    computePageRanksSingle,
+    computePersonalizedPageRanks,
+)
+from PageRank_par import BACKENDS, computePageRanksParallel
+from PageRank_stream import EDGE_ARRAYS, computePageRanksStreaming
+from RankFile import rankOrder
+from synthetic import scaleFreeGraph
+
+
+@pytest.mark.parametrize("maxIterations", [1, 2, 10, 100, 1000])
+@pytest.mark.parametrize("dangling", ["renormalize", "teleport"])
+def test_single_precision_within_iteration_budget(maxIterations, dangling):
+    # The single precision iterations and the double precision refinement
+    # together never go past maxIterations (the result is the index of the
+    # last iteration, as in computePageRanks)
+    M = scaleFreeGraph(2000).transitionMatrix()
+    p, iterations = computePageRanksSingle(M, 0.99, maxIterations, dangling=dangling)
+    assert iterations <= maxIterations - 1
+    assert np.isclose(np.sum(p), 1)
+
+
+def test_single_precision_matches_double():
+    M = scaleFreeGraph(2000).transitionMatrix()
+    p, _ = computePageRanks(M, 0.9)
+    q, _ = computePageRanksSingle(M, 0.9)
+    assert np.allclose(p, q, atol=1e-8)
+
+
+# The stopping test is np.allclose with its default rtol, so two runs that
+# stop at different iterations (other solver, warm start, direct solve) only
+# agree to about 1e-8
+ATOL = 1e-7
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return scaleFreeGraph(2000)
+
+
+@pytest.mark.parametrize("solver", ["gauss-seidel", "quadratic"])
+@pytest.mark.parametrize("dangling", ["renormalize", "teleport"])
+def test_solvers_match_jacobi(graph, solver, dangling):
+    M = graph.transitionMatrix()
+    p, _ = computePageRanks(M, 0.85, dangling=dangling)
+    q, _ = computePageRanks(M, 0.85, dangling=dangling, solver=solver)
+    assert np.allclose(p, q, rtol=0, atol=ATOL)
+
+
+@pytest.mark.parametrize("dangling", ["renormalize", "teleport"])
+def test_damped_columns_match_serial(graph, dangling):
+    M = graph.transitionMatrix()
+    dampings = [0.5, 0.85, 0.9, 0.99]
+    P, iterations = computeDampedPageRanks(M, dampings, dangling=dangling)
+    for j, l in enumerate(dampings):
+        p, k = computePageRanks(M, l, dangling=dangling)
+        assert np.allclose(P[:, j], p, rtol=0, atol=1e-9)
+        assert iterations[j] == k
+
+
+@pytest.mark.parametrize("dangling", ["renormalize", "teleport"])
+def test_personalized_columns_match_serial(graph, dangling):
+    M = graph.transitionMatrix()
+    rng = np.random.default_rng(0)
+    V = rng.random((len(graph), 5)) * (rng.random((len(graph), 5)) < 0.05)
+    P, _ = computePersonalizedPageRanks(M, V, 0.85, dangling=dangling)
+    for j in range(V.shape[1]):
+        p, _ = computePageRanks(M, 0.85, dangling=dangling, personalization=V[:, j])
+        assert np.allclose(P[:, j], p, rtol=0, atol=1e-9)
+
+
+def test_direct_matches_iteration(graph):
+    M = graph.transitionMatrix()
+    V = np.eye(len(graph))[:, :: len(graph) // 4] + 1e-3
+    P, _ = computePersonalizedPageRanks(M, V, 0.85, dangling="teleport")
+    Q, iterations = computePersonalizedPageRanks(
+        M, V, 0.85, dangling="teleport", direct=True
+    )
+    assert not np.any(iterations)
+    assert np.allclose(P, Q, rtol=0, atol=ATOL)
+
+
+@pytest.mark.parametrize("dangling", ["renormalize", "teleport"])
+def test_top_k_stop_keeps_top(graph, dangling):
+    M = graph.transitionMatrix()
+    p, full = computePageRanks(M, 0.85, dangling=dangling)
+    q, early = computePageRanks(M, 0.85, dangling=dangling, topK=10)
+    assert early < full
+    assert np.array_equal(rankOrder(p)[:10], rankOrder(q)[:10])
+
+
+def test_route_delta_matches_rebuilt_graph(graph):
+    p, _ = computePageRanks(graph.transitionMatrix(), 0.85)
+    codes = graph.codes
+    delta = pl.DataFrame(
+        {
+            "origin": [codes[graph.origin[0]], codes[1], codes[2]],
+            "destination": [codes[graph.destination[0]], codes[3], codes[4]],
+            "weight": [0, 2, 5],
+        }
+    )
+    changed, p0 = applyRouteDelta(graph, p, delta)
+
+    # The same routes, changed by hand
+    routes = {
+        (o, d): w for o, d, w in zip(graph.origin, graph.destination, graph.weight)
+    }
+    del routes[graph.origin[0], graph.destination[0]]
+    routes[1, 3] = 2
+    routes[2, 4] = 5
+    keys = sorted(routes, key=lambda od: (od[1], od[0]))
+    expected = Graph(
+        codes,
+        graph.names,
+        np.array([o for o, _ in keys]),
+        np.array([d for _, d in keys]),
+        np.array([routes[k] for k in keys], dtype=np.float64),
+    )
+    assert np.array_equal(changed.origin, expected.origin)
+    assert np.array_equal(changed.destination, expected.destination)
+    assert np.array_equal(changed.weight, expected.weight)
+
+    q, _ = computePageRanks(changed.transitionMatrix(), 0.85, p0=p0)
+    r, _ = computePageRanks(expected.transitionMatrix(), 0.85)
+    assert np.allclose(q, r, rtol=0, atol=ATOL)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("dangling", ["renormalize", "teleport"])
+def test_parallel_matches_serial(graph, backend, dangling):
+    M = graph.transitionMatrix()
+    p, k = computePageRanks(M, 0.85, dangling=dangling)
+    q, j = computePageRanksParallel(
+        M, 0.85, dangling=dangling, workers=3, backend=backend
+    )
+    assert np.allclose(p, q, rtol=0, atol=1e-12)
+    assert j == k
+
+
+@pytest.mark.parametrize("dangling", ["renormalize", "teleport"])
+def test_streaming_matches_serial(graph, tmp_path, dangling):
+    # Edge files as written by buildEdgeFiles, the graph arrays are already
+    # sorted by destination
+    edges = str(tmp_path)
+    for name, dtype in EDGE_ARRAYS.items():
+        np.save(os.path.join(edges, f"{name}.npy"), getattr(graph, name).astype(dtype))
+    np.save(os.path.join(edges, "outweight.npy"), graph.outweight())
+    with open(os.path.join(edges, "meta.json"), "w") as f:
+        json.dump({"airports": len(graph), "routes": len(graph.weight)}, f)
+
+    p, k = computePageRanks(graph.transitionMatrix(), 0.85, dangling=dangling)
+    q, j = computePageRanksStreaming(edges, 0.85, dangling=dangling, chunk_size=1000)
+    assert np.allclose(p, q, rtol=0, atol=1e-12)
+    assert j == k
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
 import pickle as pkl
 import sys
 from collections import Counter
@@ -12,6 +13,12 @@ from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import NotFoundError
 from elasticsearch_dsl import Search
 
+# The shared modules of the labs are in common/, next to the lab directories
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
+)
+from termvectors import stream_term_vectors  # noqa: E402
+
 DocTerms = Dict[str, Set[str]]
 client = Elasticsearch(timeout=1000)
 
@@ -28,16 +35,13 @@ def process_slice(
     voc: Counter[str] = Counter()
     docterms: DocTerms = {}  # document vocabulary
 
-    for s in se.scan():
+    # The term vectors are fetched in batches
+    for s, terms in stream_term_vectors(
+        client, index, se.scan(), key=lambda s: s.meta.id
+    ):
         docpath = s.path
-        docterms[docpath] = set()  # use a set for efficient operations
-        tv = client.termvectors(
-            index=index, doc_type="document", id=s.meta.id, fields=["text"]
-        )
-        if "text" in tv["term_vectors"]:
-            terms = tv["term_vectors"]["text"]["terms"]
-            docterms[docpath].update(terms.keys())
-            voc.update(terms.keys())
+        docterms[docpath] = set(terms)  # use a set for efficient operations
+        voc.update(terms.keys())
 
     return voc, docterms
 